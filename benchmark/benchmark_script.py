@@ -1,27 +1,116 @@
 import pandas as pd
+import hashlib
+import json
 import os
+import time
 import run_trino_query
+import run_trino_query_async
 import concurrent.futures
 import warmup_script
+import query_reader
+import timing_statistics
 
-def execute_queries_from_file(sql_dir, filename):
-    with open(os.path.join(sql_dir, filename), "r") as file:
-        queries = file.read().split("-- QUERY: ")
-        results = run_and_record_queries(queries)
+QUERIES_DIR = "data/queries"  # "data/queries_parquet" benchmarks the Parquet catalog instead
+RESULTS_DIR = "results"
+BENCHMARK_MODE = "serial"  # "sweep" runs every file at each of SWEEP_CONCURRENCY_LEVELS
+SWEEP_CONCURRENCY_LEVELS = [1, 2, 4, 8, 16]
+SWEEP_QUERY_TYPES = ["MATCH_RECOGNIZE", "REGEX"]
+SWEEP_RESULTS_DIR = "results-sweep"
+REPETITIONS = 5  # Measured runs per query
+WARM_ITERATIONS = 1  # Runs per query executed first and discarded
+JOURNAL_FILE = os.path.join(RESULTS_DIR, "journal.jsonl")  # Every result is appended here as soon as it arrives
+# Reuse journal results of an earlier, interrupted run. Only results for the same query
+# directory, file, query text, session config and repetition settings are reused.
+RESUME = False
+# Journal fields that identify a result rather than belong to it
+JOURNAL_FIELDS = ("file", "sql_dir", "query_hash", "repetitions", "warm_iterations")
+DEEP_STATS = False  # Fetch per-stage and per-operator statistics into {file}_operators.csv
+# Named Trino session-property sets, every serial run and concurrency sweep goes through each of them, e.g.
+# {"default": {}, "spill": {"spill_enabled": "true"}, "broadcast": {"join_distribution_type": "BROADCAST"},
+#  "task_concurrency_4": {"task_concurrency": 4}}
+SESSION_MATRIX = {"default": {}}
 
-    return results
+def execute_queries_from_file(sql_dir, filename, journal=None, completed=None, operator_file=None,
+                              session_config="default"):
+    queries = query_reader.read_queries(os.path.join(sql_dir, filename))
+    return run_and_record_queries(queries, filename, journal, completed, operator_file, session_config, sql_dir)
+
+
+def record_operator_stats(operator_file, result):
+    try:
+        rows = run_trino_query.fetch_operator_stats(result["query_id"])
+    except Exception as e:
+        print(f"❌ Operator stats failed for {result['query_id']}: {e}")
+        return
+
+    for row in rows:
+        row["query_tag"] = result["query_tag"]
+        row["query_type"] = result["query_type"]
+        row["session_config"] = result.get("session_config", "default")
+
+    df = pd.DataFrame(rows)
+    df.to_csv(operator_file, mode="a", index=False, header=not os.path.exists(operator_file))
+
+
+def load_journal(journal_file):
+    completed = {}
+    if not os.path.exists(journal_file):
+        return completed
+
+    with open(journal_file, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by an interrupted write
+
+            # Records from before the journal stored their query set cannot be matched safely
+            if "query_hash" not in record:
+                continue
+
+            # Timed-out queries count as done, a rerun would only exhaust the same budget
+            if record.get("query_id") != "FAILED":
+                key = (record["sql_dir"], record["file"], record["query_tag"], record["query_type"],
+                       record.get("session_config", "default"), record["query_hash"],
+                       record["repetitions"], record["warm_iterations"])
+                completed[key] = record
+
+    print(f"Journal {journal_file} holds {len(completed)} completed queries.")
+    return completed
+
+
+def journal_key(sql_dir, filename, query_id, query_type, session_config, query_body):
+    return (sql_dir, filename, query_id, query_type, session_config, query_hash(query_body),
+            REPETITIONS, WARM_ITERATIONS)
+
+
+def query_hash(query_body):
+    return hashlib.sha256(query_body.strip().encode()).hexdigest()
 
 
-def run_in_parallel(queries):
+def append_to_journal(journal, key, result):
+    sql_dir, filename, _, _, _, body_hash, repetitions, warm_iterations = key
+    record = {"file": filename, "sql_dir": sql_dir, "query_hash": body_hash,
+              "repetitions": repetitions, "warm_iterations": warm_iterations, **result}
+    journal.write(json.dumps(record, default=float) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def find_trace_source(query_body):
+    for line in query_body.splitlines():
+        if line.startswith("-- SOURCE: "):
+            return line[len("-- SOURCE: "):].strip()
+
+    return "events"
+
+
+def run_in_parallel(queries, max_workers=2):
     future_to_query = {}
     results = []
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        for q in queries[1:]:
-            query_id_line, query_body = q.strip().split("\n", 1)
-            query_id = query_id_line.strip()
-            query_type = "MATCH_RECOGNIZE" if "MATCH_RECOGNIZE" in query_body.upper() else "REGEX"
-            
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for query_id, query_type, query_body in queries:
             future_to_query[executor.submit(
                     run_trino_query.run_query, 
                         query_body, query_id, query_type)] = (query_id, query_body)
@@ -31,6 +120,7 @@ def run_in_parallel(queries):
             
             try:
                 result = future.result()
+                result["trace_source"] = find_trace_source(future_to_query[future][1])
                 results.append(result)
                 
             except Exception as exc:
@@ -39,37 +129,176 @@ def run_in_parallel(queries):
     return results
 
 
-def run_and_record_queries(queries):
+def run_and_record_queries(queries, filename=None, journal=None, completed=None, operator_file=None,
+                           session_config="default", sql_dir=None):
     results = []
+    completed = completed or {}
+    session_properties = SESSION_MATRIX.get(session_config, {})
+    reused = 0
     
-    for index, q in enumerate(queries[1:]):  # Skip the header
-        query_id_line, query_body = q.strip().split("\n", 1)
-        query_id = query_id_line.strip()
-        query_type = "MATCH_RECOGNIZE" if "MATCH_RECOGNIZE" in query_body.upper() else "REGEX"
-        print(f"\rExecuting query {index + 1}/{len(queries) - 1}", end='', flush=True)
-        result = run_trino_query.run_query(query_body, query_id, query_type)
+    for index, (query_id, query_type, query_body) in enumerate(queries):
+        key = journal_key(sql_dir, filename, query_id, query_type, session_config, query_body)
+        previous = completed.get(key)
+        if previous is not None:
+            results.append({field: value for field, value in previous.items() if field not in JOURNAL_FIELDS})
+            reused += 1
+            continue
+
+        print(f"\rExecuting query {index + 1}", end='', flush=True)
+        result = run_repeated_query(query_body, query_id, query_type, session_properties)
+        result["trace_source"] = find_trace_source(query_body)
+        result["session_config"] = session_config
+        result["session_properties"] = run_trino_query.session_header(session_properties)
         results.append(result)
 
+        if operator_file is not None and result["query_id"] != "FAILED":
+            record_operator_stats(operator_file, result)
+
+        if journal is not None:
+            append_to_journal(journal, key, result)
+
     print()
+    if reused:
+        print(f"Reused {reused} results from the journal for {filename} [{session_config}].")
+
     return results
 
-warmup_script.run_warmup_script()
 
-for model_num in range(0, 16):
-    sql_dir = f"data/queries/model{model_num}"
-    
-    for filename in os.listdir(sql_dir):
-        if filename.endswith(".sql"):
-            print(f"Processing file: {filename}")
-            
-            model_version = filename.split(".")[0]
-            output_file = os.path.join(
-                'results', f'model{model_num}', f'{model_version}_results.csv')
-            
-            results = execute_queries_from_file(sql_dir, filename)
-            
-            output_dir = f'results/model{model_num}'
-            os.makedirs(output_dir, exist_ok=True)
-            
-            df = pd.DataFrame(results)
-            df.to_csv(output_file, index=False)
+def run_repeated_query(query_body, query_id, query_type, session_properties=None):
+    for _ in range(WARM_ITERATIONS):
+        warm_run = run_trino_query.run_query(query_body, query_id, query_type,
+                                             session_properties=session_properties)
+
+        # A query that ran out of budget once would only burn it again on every repetition
+        if warm_run["status"] == "TIMEOUT":
+            return warm_run
+
+    runs = []
+    for _ in range(REPETITIONS):
+        run = run_trino_query.run_query(query_body, query_id, query_type, session_properties=session_properties)
+        if run["status"] == "TIMEOUT":
+            return run
+
+        runs.append(run)
+
+    failed_runs = [run for run in runs if run["query_id"] == "FAILED"]
+    if failed_runs:
+        return failed_runs[0]
+
+    # The first measured run keeps the identifying columns, timings become means over all runs
+    result = dict(runs[0])
+    result["repetitions"] = len(runs)
+
+    for metric in ["elapsed_millis", "cpu_time_millis", "direct_execution_time_sec"]:
+        summary = timing_statistics.summarize_samples([run[metric] for run in runs], metric)
+        result[metric] = summary.get(f"{metric}_mean", result[metric])
+        result.update(summary)
+
+    if result["total_rows_processed"]:
+        result["cpu_time_per_million_rows"] = result["cpu_time_millis"] / (result["total_rows_processed"] / 1_000_000)
+
+    return result
+
+def run_concurrency_sweep(sql_dir, filename):
+    sweep_results = []
+
+    for session_config, session_properties in SESSION_MATRIX.items():
+        for query_type in SWEEP_QUERY_TYPES:
+            for concurrency in SWEEP_CONCURRENCY_LEVELS:
+                queries = (record for record in query_reader.read_queries(os.path.join(sql_dir, filename))
+                           if record[1] == query_type)
+
+                start_time = time.time()
+                results = run_trino_query_async.run_queries_concurrently(
+                    queries, max_in_flight=concurrency, session_properties=session_properties)
+                wall_time = time.time() - start_time
+
+                summary = {"session_config": session_config,
+                           "session_properties": run_trino_query.session_header(session_properties),
+                           "query_type": query_type, "concurrency": concurrency}
+                summary.update(summarize_sweep_level(results, wall_time))
+                sweep_results.append(summary)
+
+                print(f"[{session_config}] [{query_type}] concurrency={concurrency}: "
+                      f"{summary['throughput_qpm']:.1f} queries/min, p95 {summary['latency_p95_sec']:.2f}s")
+
+    return sweep_results
+
+
+def summarize_sweep_level(results, wall_time):
+    df = pd.DataFrame(results)
+    succeeded = df[df["status"] == "FINISHED"] if not df.empty else df
+    latencies = succeeded["direct_execution_time_sec"] if not succeeded.empty else pd.Series(dtype=float)
+    queued = succeeded["queued_millis"].dropna() if not succeeded.empty else pd.Series(dtype=float)
+
+    return {
+        "queries": len(df),
+        "failed": len(df) - len(succeeded),
+        "timed_out": int((df["status"] == "TIMEOUT").sum()) if not df.empty else 0,
+        "wall_time_sec": wall_time,
+        "throughput_qpm": len(succeeded) / wall_time * 60 if wall_time > 0 else 0,
+        "latency_mean_sec": latencies.mean(),
+        "latency_p50_sec": latencies.quantile(0.50),
+        "latency_p90_sec": latencies.quantile(0.90),
+        "latency_p95_sec": latencies.quantile(0.95),
+        "latency_p99_sec": latencies.quantile(0.99),
+        "queued_millis_mean": queued.mean(),
+        "queued_millis_p95": queued.quantile(0.95),
+    }
+
+
+def run_benchmark():
+    completed = load_journal(JOURNAL_FILE) if RESUME else {}
+    os.makedirs(os.path.dirname(JOURNAL_FILE), exist_ok=True)
+
+    # Always appended, never truncated: a run started without RESUME must not erase the
+    # results an interrupted run left behind. Keys carry the query hash, so old records
+    # are only ever reused for the same query.
+    with open(JOURNAL_FILE, "a") as journal:
+        # Terminate a line left unfinished by an interrupted run before appending
+        if journal.tell() > 0:
+            with open(JOURNAL_FILE, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    journal.write("\n")
+
+        run_all_files(journal, completed)
+
+
+def run_all_files(journal, completed):
+    for model_num in range(0, 16):
+        sql_dir = os.path.join(QUERIES_DIR, f"model{model_num}")
+        
+        for filename in os.listdir(sql_dir):
+            if filename.endswith(".sql"):
+                print(f"Processing file: {filename}")
+                
+                model_version = filename.split(".")[0]
+
+                if BENCHMARK_MODE == "sweep":
+                    results = run_concurrency_sweep(sql_dir, filename)
+                    output_dir = os.path.join(SWEEP_RESULTS_DIR, f'model{model_num}')
+                    output_file = os.path.join(output_dir, f'{model_version}_sweep.csv')
+
+                else:
+                    output_dir = os.path.join(RESULTS_DIR, f'model{model_num}')
+                    output_file = os.path.join(output_dir, f'{model_version}_results.csv')
+                    operator_file = None
+                    if DEEP_STATS:
+                        os.makedirs(output_dir, exist_ok=True)
+                        operator_file = os.path.join(output_dir, f'{model_version}_operators.csv')
+
+                    results = []
+                    for session_config in SESSION_MATRIX:
+                        results.extend(execute_queries_from_file(
+                            sql_dir, filename, journal, completed, operator_file, session_config))
+                
+                os.makedirs(output_dir, exist_ok=True)
+                
+                df = pd.DataFrame(results)
+                df.to_csv(output_file, index=False)
+
+
+if __name__ == "__main__":
+    warmup_script.run_warmup_script(QUERIES_DIR)
+    run_benchmark()
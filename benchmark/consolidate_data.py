@@ -18,9 +18,32 @@ for filename in all_files_recursive:
     dataFrame["elapsed_per_million_rows"] = (dataFrame["elapsed_millis"] / dataFrame["total_rows_processed"]) * 1e6
     dataFrame["peak_memory_per_million_rows"] = (dataFrame["peak_memory_mb"] / dataFrame["total_rows_processed"]) * 1e6
     
-    if "error" not in dataFrame.columns:
-        dataFrames.append(dataFrame)
+    # Results from repeated runs carry a bootstrap interval around the mean elapsed time
+    if "elapsed_millis_ci_low" in dataFrame.columns:
+        dataFrame["elapsed_per_million_rows_ci_low"] = (dataFrame["elapsed_millis_ci_low"] / dataFrame["total_rows_processed"]) * 1e6
+        dataFrame["elapsed_per_million_rows_ci_high"] = (dataFrame["elapsed_millis_ci_high"] / dataFrame["total_rows_processed"]) * 1e6
+    
+    # Timed-out and failed runs are recorded next to the finished ones but carry no comparable timings
+    if "status" in dataFrame.columns:
+        dataFrames.append(dataFrame[dataFrame["status"] == "FINISHED"])
+
+    elif "error" not in dataFrame.columns:
+        dataFrames.append(dataFrame)  # Older files without a status column
     
 combined_data = pd.concat(dataFrames, ignore_index=True)
 
-combined_data.to_csv("combined_results_2.csv", index=False)
\ No newline at end of file
+# Results from before the session matrix ran with the default Trino session
+if "session_config" not in combined_data.columns:
+    combined_data["session_config"] = "default"
+combined_data["session_config"] = combined_data["session_config"].fillna("default")
+
+combined_data.to_csv("combined_results_2.csv", index=False)
+
+# One column per session-property set, so configurations can be compared side by side
+by_session = combined_data.pivot_table(
+    index=["model", "percentage", "query_type"],
+    columns="session_config",
+    values="elapsed_per_million_rows",
+    aggfunc="mean")
+
+by_session.to_csv("combined_results_by_session.csv")
\ No newline at end of file
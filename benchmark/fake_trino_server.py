@@ -0,0 +1,239 @@
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOST = "127.0.0.1"
+PORT = 8081
+MODE = "replay"  # "replay" serves fixtures or synthetic pages, "record" proxies UPSTREAM_URL and saves fixtures
+UPSTREAM_URL = "http://localhost:8080"
+FIXTURE_FILE = os.path.join("data", "fixtures", "trino_responses.json")
+PAGE_COUNT = 3  # Pages per synthetic query, including the first and the final one (at least 2)
+PAGE_DELAY_SEC = 0.0  # Sleep before serving each followed page
+SYNTHETIC_RESULT = 0  # Value returned as the single result cell of synthetic queries
+
+STATEMENT_PATH = re.compile(r"^/v1/statement/executing/(?P<query_id>[^/]+)/(?P<token>\d+)$")
+QUERY_INFO_PATH = re.compile(r"^/v1/query/(?P<query_id>[^/]+)$")
+
+
+class StandInState:
+    def __init__(self, mode, fixture_file, page_count, page_delay, upstream_url):
+        self.mode = mode
+        self.fixture_file = fixture_file
+        self.page_count = max(page_count, 2)
+        self.page_delay = page_delay
+        self.upstream_url = upstream_url.rstrip("/")
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.queries = {}
+        self.fixtures = load_fixtures(fixture_file)
+        self.upstream = requests.Session()
+
+    def next_query_id(self):
+        with self.lock:
+            return f"standin_{next(self.ids)}"
+
+    def save_fixture(self, key, fixture):
+        with self.lock:
+            self.fixtures[key] = fixture
+            os.makedirs(os.path.dirname(self.fixture_file) or ".", exist_ok=True)
+
+            temporary_file = f"{self.fixture_file}.tmp"
+            with open(temporary_file, "w") as file:
+                json.dump(self.fixtures, file)
+
+            os.replace(temporary_file, self.fixture_file)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients reuse their pooled connections
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024  # Headers and body leave in one write instead of two small packets
+
+    def do_POST(self):
+        if self.path != "/v1/statement":
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        query = self.rfile.read(length).decode()
+        state = self.server.state
+        query_id = state.next_query_id()
+
+        if state.mode == "record":
+            response = state.upstream.post(
+                f"{state.upstream_url}/v1/statement", data=query.encode("utf-8"), headers=self._forwarded_headers())
+            response.raise_for_status()
+            page = response.json()
+            state.queries[query_id] = {"key": fixture_key(query), "query": query, "upstream_id": page.get("id"),
+                                       "pages": [page], "upstream_next": page.get("nextUri")}
+
+        else:
+            fixture = state.fixtures.get(fixture_key(query))
+            pages = fixture["pages"] if fixture else synthetic_pages(state.page_count)
+            state.queries[query_id] = {"pages": pages, "query_info": fixture and fixture.get("query_info")}
+            page = pages[0]
+
+        self._send_json(200, self._rewrite_page(page, query_id, 0))
+
+    def do_GET(self):
+        state = self.server.state
+        statement_match = STATEMENT_PATH.match(self.path)
+        query_info_match = QUERY_INFO_PATH.match(self.path)
+
+        if statement_match:
+            query_id = statement_match.group("query_id")
+            token = int(statement_match.group("token"))
+            query = state.queries.get(query_id)
+
+            if query is None:
+                self._send_json(404, {"error": {"message": f"Unknown query {query_id}"}})
+                return
+
+            if state.page_delay:
+                time.sleep(state.page_delay)
+
+            if state.mode == "record":
+                response = state.upstream.get(query["upstream_next"], headers=self._forwarded_headers())
+                response.raise_for_status()
+                page = response.json()
+                query["pages"].append(page)
+                query["upstream_next"] = page.get("nextUri")
+
+                if "nextUri" not in page:
+                    state.save_fixture(query["key"], {"query": query["query"], "pages": query["pages"]})
+                    # The pages now live in the fixtures, /v1/query only needs the upstream id
+                    state.queries[query_id] = {"key": query["key"], "upstream_id": query["upstream_id"]}
+
+            else:
+                page = query["pages"][min(token, len(query["pages"]) - 1)]
+                if "nextUri" not in page:
+                    # Only what /v1/query still needs is kept once a query is finished
+                    if query.get("query_info"):
+                        state.queries[query_id] = {"query_info": query["query_info"]}
+                    else:
+                        state.queries.pop(query_id, None)
+
+            self._send_json(200, self._rewrite_page(page, query_id, token))
+
+        elif query_info_match:
+            query_id = query_info_match.group("query_id")
+            self._send_json(200, self._query_info(query_id, state))
+
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_DELETE(self):
+        state = self.server.state
+        statement_match = STATEMENT_PATH.match(self.path)
+        if statement_match:
+            query = state.queries.pop(statement_match.group("query_id"), None)
+
+            # Cancel the real query as well, otherwise it keeps running on the upstream coordinator
+            if state.mode == "record" and query and query.get("upstream_next"):
+                try:
+                    state.upstream.delete(query["upstream_next"], headers=self._forwarded_headers())
+                except requests.RequestException as e:
+                    print(f"❌ Cancelling upstream query {query.get('upstream_id')} failed: {e}")
+
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # Per-request logging would dominate the cost at high query rates
+
+    def _query_info(self, query_id, state):
+        query = state.queries.get(query_id) or {}
+
+        if state.mode == "record" and "upstream_id" in query:
+            response = state.upstream.get(
+                f"{state.upstream_url}/v1/query/{query['upstream_id']}", headers=self._forwarded_headers())
+            response.raise_for_status()
+            query_info = response.json()
+            # Finished queries already saved their pages, running ones still hold them here
+            fixture = ({"query": query["query"], "pages": query["pages"]} if "pages" in query
+                       else state.fixtures.get(query["key"], {}))
+            state.save_fixture(query["key"], {**fixture, "query_info": query_info})
+            return query_info
+
+        return query.get("query_info") or {"queryId": query_id, "stages": {"stages": []}}
+
+    def _rewrite_page(self, page, query_id, token):
+        page = dict(page)
+        page["id"] = query_id
+
+        if "nextUri" in page:
+            host = self.headers.get("Host", f"{HOST}:{PORT}")
+            page["nextUri"] = f"http://{host}/v1/statement/executing/{query_id}/{token + 1}"
+
+        return page
+
+    def _forwarded_headers(self):
+        return {name: value for name, value in self.headers.items() if name.lower().startswith("x-trino-")}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def fixture_key(query):
+    return hashlib.sha256(query.strip().encode()).hexdigest()
+
+
+def load_fixtures(fixture_file):
+    if not os.path.exists(fixture_file):
+        return {}
+
+    with open(fixture_file, "r") as file:
+        return json.load(file)
+
+
+def synthetic_pages(page_count):
+    running_stats = {"state": "RUNNING", "queuedTimeMillis": 0, "elapsedTimeMillis": 0,
+                     "cpuTimeMillis": 0, "processedRows": 0, "peakMemoryBytes": 0}
+    # nextUri placeholders are filled in with the stand-in's own address when served
+    pages = [{"nextUri": None, "stats": dict(running_stats, state="QUEUED")}]
+    pages += [{"nextUri": None, "stats": running_stats} for _ in range(page_count - 1)]
+
+    pages[-1] = {
+        "columns": [{"name": "_col0", "type": "bigint"}],
+        "data": [[SYNTHETIC_RESULT]],
+        "stats": {"state": "FINISHED", "queuedTimeMillis": 0, "elapsedTimeMillis": 1,
+                  "cpuTimeMillis": 1, "processedRows": 1_000_000, "peakMemoryBytes": 0},
+    }
+
+    return pages
+
+
+def start_server(host=HOST, port=PORT, mode=MODE, fixture_file=FIXTURE_FILE,
+                 page_count=PAGE_COUNT, page_delay=PAGE_DELAY_SEC, upstream_url=UPSTREAM_URL):
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.state = StandInState(mode, fixture_file, page_count, page_delay, upstream_url)
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Stand-in Trino ({mode}) listening on http://{host}:{server.server_port}")
+
+    return server
+
+
+if __name__ == "__main__":
+    server = start_server()
+
+    try:
+        while True:
+            time.sleep(1)
+
+    except KeyboardInterrupt:
+        server.shutdown()
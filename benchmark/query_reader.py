@@ -0,0 +1,40 @@
+QUERY_HEADER = "-- QUERY: "
+TYPE_HEADER = "-- TYPE: "
+
+
+def read_queries(file_path):
+    query_id = None
+    declared_type = None
+    lines = []
+
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if line.startswith(QUERY_HEADER):
+                if query_id is not None:
+                    yield _build_record(query_id, declared_type, lines)
+
+                query_id = line[len(QUERY_HEADER):].strip()
+                declared_type = None
+                lines = []
+                continue
+
+            if query_id is None:
+                continue  # Anything before the first header is not part of a query
+
+            if declared_type is None and line.startswith(TYPE_HEADER):
+                declared_type = line[len(TYPE_HEADER):].strip()
+
+            lines.append(line)
+
+    if query_id is not None:
+        yield _build_record(query_id, declared_type, lines)
+
+
+def _build_record(query_id, declared_type, lines):
+    sql = "".join(lines).strip()
+
+    if declared_type is None:
+        # Older query files without a TYPE header
+        declared_type = "MATCH_RECOGNIZE" if "MATCH_RECOGNIZE" in sql.upper() else "REGEX"
+
+    return query_id, declared_type.upper(), sql
@@ -1,96 +1,339 @@
+import json
+import os
+import re
 import requests
 import time
+import urllib.parse
 
-TRINO_URL = "http://localhost:8080/v1/statement"  # Adjust as needed
+TRINO_URL = os.environ.get("TRINO_URL", "http://localhost:8080/v1/statement")  # Adjust as needed
 HEADERS = {
     "X-Trino-User": "benchmark_user",
     "X-Trino-Catalog": "postgresql",
     "X-Trino-Schema": "public"
 }
 
+DURATION_UNITS_MILLIS = {"ns": 1e-6, "us": 1e-3, "ms": 1, "s": 1e3, "m": 60e3, "h": 3600e3, "d": 86400e3}
+DATA_SIZE_UNITS_BYTES = {"B": 1, "kB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4, "PB": 1024**5}
+
+RESULT_MODE = "scalar"  # "scalar" keeps the first cell, "discard" only counts, "stream-to-file" writes every page
+RESULT_OUTPUT_DIR = os.path.join("results", "query_output")  # One JSON-lines file per query in stream-to-file mode
+QUERY_TIMEOUT_SEC = 600  # Wall-clock budget per query run, None waits without limit
+QUERY_TYPE_TIMEOUTS_SEC = {}  # Budgets for single query types, e.g. {"REGEX": 300}
+CANCEL_TIMEOUT_SEC = 10  # How long the cancellation request may take
+
 session = requests.Session()
 
-def run_query(query, tag, query_type):
+
+class QueryTimeout(Exception):
+    def __init__(self, data, query_id, timeout):
+        super().__init__(f"Query {query_id} exceeded its budget of {timeout}s")
+        self.data = data
+        self.query_id = query_id
+
+
+class DiscardResult:
+    def __init__(self):
+        self.first_cell = None
+        self.rows_received = 0
+        self.bytes_received = 0
+
+    def add_page(self, data, page_bytes):
+        self.bytes_received += page_bytes
+        rows = data.get("data")
+        if not rows:
+            return
+
+        self.rows_received += len(rows)
+        self._consume_rows(data, rows)
+
+    def _consume_rows(self, data, rows):
+        pass  # Rows are dropped as soon as they are counted
+
+    def close(self):
+        pass
+
+
+class ScalarResult(DiscardResult):
+    def _consume_rows(self, data, rows):
+        if self.first_cell is None:
+            self.first_cell = rows[0][0]
+
+
+class StreamToFileResult(ScalarResult):
+    def __init__(self, output_dir):
+        super().__init__()
+        self.output_dir = output_dir
+        self.file = None
+
+    def _consume_rows(self, data, rows):
+        super()._consume_rows(data, rows)
+
+        if self.file is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self.file = open(os.path.join(self.output_dir, f"{data.get('id', 'unknown')}.jsonl"), "w")
+
+        for row in rows:
+            self.file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def create_result_sink(result_mode=RESULT_MODE):
+    if result_mode == "discard":
+        return DiscardResult()
+
+    if result_mode == "stream-to-file":
+        return StreamToFileResult(RESULT_OUTPUT_DIR)
+
+    return ScalarResult()
+
+
+def query_timeout(query_type):
+    return QUERY_TYPE_TIMEOUTS_SEC.get(query_type, QUERY_TIMEOUT_SEC)
+
+
+def session_header(session_properties):
+    # Trino expects comma-separated name=value pairs with URL-encoded values
+    return ",".join(f"{name}={urllib.parse.quote(str(value))}" for name, value in session_properties.items())
+
+
+def query_headers(session_properties=None):
+    if not session_properties:
+        return HEADERS
+
+    return {**HEADERS, "X-Trino-Session": session_header(session_properties)}
+
+
+def run_query(query, tag, query_type, result_mode=None, timeout=None, session_properties=None):
     start_time = time.time()
+    sink = create_result_sink(result_mode or RESULT_MODE)
+    timeout = timeout if timeout is not None else query_timeout(query_type)
+    deadline = start_time + timeout if timeout else None
 
     try: 
-        data = _send_query(query)
-        data, query_id, all_rows = _poll_query_results(data)
+        data, page_bytes = _send_query(query, deadline, session_properties, timeout)
+        data, query_id = _poll_query_results(data, page_bytes, sink, deadline, timeout)
         
         end_time = time.time()
         
-        _append_query_data(data, all_rows)
-        stats = data.get("stats", {})
-        result_case_count = all_rows[0][0] if all_rows else 0
-        
-        total_rows = stats.get("processedRows", 0)
-        cpu_time = stats.get("cpuTimeMillis", 0)
-        cpu_time_per_million_rows = cpu_time / (total_rows / 1_000_000)
-        
-        result = {
-            "query_id": query_id,
-            "query_tag": tag,
-            "query_type": query_type,
-            "result_case_count": result_case_count,
-            "direct_execution_time_sec": end_time - start_time,
-            "elapsed_millis": stats.get("elapsedTimeMillis"),
-            "cpu_time_millis": cpu_time,
-            "cpu_time_per_million_rows": cpu_time_per_million_rows,
-            "queued_millis": stats.get("queuedTimeMillis"),
-            "peak_memory_mb": round(stats.get("peakMemoryBytes", 0) / 1024**2, 2),
-            "total_rows_processed": total_rows,
-        }
+        result = _build_result(data, query_id, sink, tag, query_type, end_time - start_time)
+
+    except QueryTimeout as e:
+        print(f"⏱️ Query timed out for [{query_type}] tag={tag}: {e}")
+        result = _build_timeout_result(e, sink, tag, query_type, time.time() - start_time)
         
     except Exception as e:
         print(f"❌ Query failed for [{query_type}] tag={tag}: {e}")
-        result = {
-            "query_id": "FAILED",
-            "query_tag": tag,
-            "query_type": query_type,
-            "result_case_count": 0,
-            "direct_execution_time_sec": 0,
-            "elapsed_millis": None,
-            "cpu_time_millis": None,
-            "queued_millis": None,
-            "peak_memory_mb": None,
-            "total_rows_processed": 0,
-            "error": str(e),
-        }
+        result = _build_failed_result(tag, query_type, e)
+
+    finally:
+        sink.close()
     
     return result
 
 
-def _append_query_data(data, all_rows):
-    if "data" in data:
-        all_rows.extend(data["data"])
+def _build_result(data, query_id, sink, tag, query_type, execution_time):
+    stats = data.get("stats", {})
+    result_case_count = sink.first_cell if sink.first_cell is not None else 0
+    
+    total_rows = stats.get("processedRows", 0)
+    cpu_time = stats.get("cpuTimeMillis", 0)
+    cpu_time_per_million_rows = cpu_time / (total_rows / 1_000_000) if total_rows else None
+    
+    return {
+        "query_id": query_id,
+        "status": "FINISHED",
+        "query_tag": tag,
+        "query_type": query_type,
+        "result_case_count": result_case_count,
+        "direct_execution_time_sec": execution_time,
+        "elapsed_millis": stats.get("elapsedTimeMillis"),
+        "cpu_time_millis": cpu_time,
+        "cpu_time_per_million_rows": cpu_time_per_million_rows,
+        "queued_millis": stats.get("queuedTimeMillis"),
+        "peak_memory_mb": round(stats.get("peakMemoryBytes", 0) / 1024**2, 2),
+        "total_rows_processed": total_rows,
+        "rows_received": sink.rows_received,
+        "bytes_received": sink.bytes_received,
+    }
 
 
-def _send_query(query):
-    response = session.post(TRINO_URL, data=query, headers=HEADERS)
+def _build_timeout_result(timeout_error, sink, tag, query_type, execution_time):
+    # Stats are the partial ones from the last page seen before the query was cancelled
+    result = _build_result(timeout_error.data, timeout_error.query_id, sink, tag, query_type, execution_time)
+    result["status"] = "TIMEOUT"
+    result["timeout_reason"] = str(timeout_error)  # Not "error", which marks a whole file as failed
+
+    return result
+
+
+def _build_failed_result(tag, query_type, error):
+    return {
+        "query_id": "FAILED",
+        "status": "FAILED",
+        "query_tag": tag,
+        "query_type": query_type,
+        "result_case_count": 0,
+        "direct_execution_time_sec": 0,
+        "elapsed_millis": None,
+        "cpu_time_millis": None,
+        "queued_millis": None,
+        "peak_memory_mb": None,
+        "total_rows_processed": 0,
+        "rows_received": 0,
+        "bytes_received": 0,
+        "error": str(error),
+    }
+
+
+def _send_query(query, deadline=None, session_properties=None, timeout=None):
+    try:
+        response = session.post(TRINO_URL, data=query.encode("utf-8"), headers=query_headers(session_properties),
+                                timeout=_remaining_time(deadline))
+    except requests.Timeout:
+        # No query id came back yet, so there is nothing to cancel
+        raise QueryTimeout({}, "unknown", timeout)
     response.raise_for_status()
     
-    return response.json()
+    return response.json(), len(response.content)
 
 
-def _follow_next_page(data):
-    response = session.get(data["nextUri"])
+def _follow_next_page(data, deadline=None):
+    response = session.get(data["nextUri"], timeout=_remaining_time(deadline))
     response.raise_for_status()
     
-    return response.json() # Update with the next page
+    return response.json(), len(response.content) # Update with the next page
+
+
+def _remaining_time(deadline):
+    if deadline is None:
+        return None
+
+    return max(deadline - time.time(), 0.001)
 
 
-def _poll_query_results(data):
-    all_rows = []
-    query_id = "unknown"
+def _cancel_query(data):
+    # DELETE on the next URI tells the coordinator to abandon the query and free its workers
+    try:
+        session.delete(data["nextUri"], timeout=CANCEL_TIMEOUT_SEC)
+    except requests.RequestException as e:
+        print(f"❌ Cancelling query {data.get('id', 'unknown')} failed: {e}")
+
+
+def _poll_query_results(data, page_bytes, sink, deadline=None, timeout=None):
+    query_id = data.get("id", "unknown")
     
     while "nextUri" in data:
-        _append_query_data(data, all_rows)
-        data = _follow_next_page(data)
+        sink.add_page(data, page_bytes)
+
+        if deadline is not None and time.time() >= deadline:
+            _cancel_query(data)
+            raise QueryTimeout(data, query_id, timeout)
+
+        try:
+            next_data, page_bytes = _follow_next_page(data, deadline)
+        except requests.Timeout:
+            _cancel_query(data)
+            raise QueryTimeout(data, query_id, timeout)
+
+        data = next_data
     
         if "id" in data:
             query_id = data["id"]
             
         if "error" in data:
             raise Exception(f"Error during execution: {data['error'].get('message')}")
-        
-    return data,query_id, all_rows
+
+    sink.add_page(data, page_bytes)
+    return data, query_id
+
+
+def fetch_operator_stats(query_id):
+    query_info_url = TRINO_URL.rsplit("/v1/", 1)[0] + "/v1/query"
+    response = session.get(f"{query_info_url}/{query_id}", headers=HEADERS)
+    response.raise_for_status()
+    query_info = response.json()
+
+    rows = []
+    for stage in _iterate_stages(query_info):
+        stage_id = stage.get("stageId")
+        stage_stats = stage.get("stageStats", {})
+
+        rows.append({
+            "query_id": query_id,
+            "level": "stage",
+            "stage_id": stage_id,
+            "pipeline_id": None,
+            "operator_id": None,
+            "plan_node_id": None,
+            "operator_type": None,
+            "cpu_millis": _parse_duration_millis(stage_stats.get("totalCpuTime")),
+            "wall_millis": _parse_duration_millis(stage_stats.get("totalScheduledTime")),
+            "blocked_millis": _parse_duration_millis(stage_stats.get("totalBlockedTime")),
+            "input_rows": stage_stats.get("rawInputPositions"),
+            "input_bytes": _parse_data_size_bytes(stage_stats.get("rawInputDataSize")),
+            "output_rows": stage_stats.get("outputPositions"),
+            "output_bytes": _parse_data_size_bytes(stage_stats.get("outputDataSize")),
+            "spilled_bytes": _parse_data_size_bytes(stage_stats.get("spilledDataSize")),
+        })
+
+        for operator in stage_stats.get("operatorSummaries", []):
+            rows.append({
+                "query_id": query_id,
+                "level": "operator",
+                "stage_id": stage_id,
+                "pipeline_id": operator.get("pipelineId"),
+                "operator_id": operator.get("operatorId"),
+                "plan_node_id": operator.get("planNodeId"),
+                "operator_type": operator.get("operatorType"),
+                "cpu_millis": sum(_parse_duration_millis(operator.get(key))
+                                  for key in ["addInputCpu", "getOutputCpu", "finishCpu"]),
+                "wall_millis": sum(_parse_duration_millis(operator.get(key))
+                                   for key in ["addInputWall", "getOutputWall", "finishWall"]),
+                "blocked_millis": _parse_duration_millis(operator.get("blockedWall")),
+                "input_rows": operator.get("inputPositions"),
+                "input_bytes": _parse_data_size_bytes(operator.get("inputDataSize")),
+                "output_rows": operator.get("outputPositions"),
+                "output_bytes": _parse_data_size_bytes(operator.get("outputDataSize")),
+                "spilled_bytes": _parse_data_size_bytes(operator.get("spilledDataSize")),
+            })
+
+    return rows
+
+
+def _iterate_stages(query_info):
+    # Newer coordinators return a flat "stages" list, older ones a nested "outputStage" tree
+    stages = query_info.get("stages")
+    if isinstance(stages, dict):
+        yield from stages.get("stages", [])
+        return
+
+    pending = [query_info["outputStage"]] if query_info.get("outputStage") else []
+    while pending:
+        stage = pending.pop()
+        yield stage
+        pending.extend(stage.get("subStages", []))
+
+
+def _parse_duration_millis(value):
+    return _parse_with_units(value, DURATION_UNITS_MILLIS)
+
+
+def _parse_data_size_bytes(value):
+    return _parse_with_units(value, DATA_SIZE_UNITS_BYTES)
+
+
+def _parse_with_units(value, units):
+    if value is None:
+        return 0
+
+    if isinstance(value, (int, float)):
+        return value
+
+    match = re.fullmatch(r"\s*([\d.]+)\s*([a-zA-Z]+)\s*", value)
+    if not match or match.group(2) not in units:
+        return 0
+
+    return float(match.group(1)) * units[match.group(2)]
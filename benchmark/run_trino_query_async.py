@@ -0,0 +1,131 @@
+import asyncio
+import json
+import time
+import aiohttp
+import run_trino_query
+
+MAX_IN_FLIGHT = 32  # Queries allowed to run on the coordinator at the same time
+CONNECTION_LIMIT = 64  # Open HTTP connections shared by all queries
+
+
+class AsyncTrinoClient:
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, connection_limit=CONNECTION_LIMIT):
+        self.max_in_flight = max_in_flight
+        self.connection_limit = connection_limit
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.connection_limit)
+        self.session = aiohttp.ClientSession(connector=connector, headers=run_trino_query.HEADERS)
+        self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.session.close()
+
+    async def run_query(self, query, tag, query_type, result_mode=None, timeout=None, session_properties=None):
+        async with self.semaphore:
+            start_time = time.time()
+            sink = run_trino_query.create_result_sink(result_mode or run_trino_query.RESULT_MODE)
+            timeout = timeout if timeout is not None else run_trino_query.query_timeout(query_type)
+            deadline = start_time + timeout if timeout else None
+
+            try:
+                data, page_bytes = await self._send_query(query, deadline, session_properties, timeout)
+                data, query_id = await self._poll_query_results(data, page_bytes, sink, deadline, timeout)
+
+                end_time = time.time()
+
+                result = run_trino_query._build_result(
+                    data, query_id, sink, tag, query_type, end_time - start_time)
+
+            except run_trino_query.QueryTimeout as e:
+                print(f"⏱️ Query timed out for [{query_type}] tag={tag}: {e}")
+                result = run_trino_query._build_timeout_result(e, sink, tag, query_type, time.time() - start_time)
+
+            except Exception as e:
+                print(f"❌ Query failed for [{query_type}] tag={tag}: {e}")
+                result = run_trino_query._build_failed_result(tag, query_type, e)
+
+            finally:
+                sink.close()
+
+            return result
+
+    async def run_queries(self, queries, session_properties=None):
+        tasks = [self.run_query(query_body, query_id, query_type, session_properties=session_properties)
+                 for query_id, query_type, query_body in queries]
+
+        return await asyncio.gather(*tasks)
+
+    async def _send_query(self, query, deadline=None, session_properties=None, timeout=None):
+        try:
+            async with self.session.post(run_trino_query.TRINO_URL, data=query,
+                                         headers=run_trino_query.query_headers(session_properties),
+                                         timeout=_client_timeout(deadline)) as response:
+                response.raise_for_status()
+                body = await response.read()
+                return json.loads(body), len(body)
+
+        except asyncio.TimeoutError:
+            # No query id came back yet, so there is nothing to cancel
+            raise run_trino_query.QueryTimeout({}, "unknown", timeout)
+
+    async def _follow_next_page(self, data, deadline=None):
+        async with self.session.get(data["nextUri"], timeout=_client_timeout(deadline)) as response:
+            response.raise_for_status()
+            body = await response.read()
+            return json.loads(body), len(body)
+
+    async def _cancel_query(self, data):
+        try:
+            timeout = aiohttp.ClientTimeout(total=run_trino_query.CANCEL_TIMEOUT_SEC)
+            async with self.session.delete(data["nextUri"], timeout=timeout):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"❌ Cancelling query {data.get('id', 'unknown')} failed: {e}")
+
+    async def _poll_query_results(self, data, page_bytes, sink, deadline=None, timeout=None):
+        query_id = data.get("id", "unknown")
+
+        # No sleep between pages: the coordinator long-polls nextUri until it has something new,
+        # like the synchronous client relies on
+        while "nextUri" in data:
+            sink.add_page(data, page_bytes)
+
+            if deadline is not None and time.time() >= deadline:
+                await self._cancel_query(data)
+                raise run_trino_query.QueryTimeout(data, query_id, timeout)
+
+            try:
+                next_data, page_bytes = await self._follow_next_page(data, deadline)
+            except asyncio.TimeoutError:
+                await self._cancel_query(data)
+                raise run_trino_query.QueryTimeout(data, query_id, timeout)
+
+            data = next_data
+
+            if "id" in data:
+                query_id = data["id"]
+
+            if "error" in data:
+                raise Exception(f"Error during execution: {data['error'].get('message')}")
+
+        sink.add_page(data, page_bytes)
+        return data, query_id
+
+
+def _client_timeout(deadline):
+    if deadline is None:
+        return aiohttp.ClientTimeout(total=None)
+
+    return aiohttp.ClientTimeout(total=max(deadline - time.time(), 0.001))
+
+
+def run_queries_concurrently(queries, max_in_flight=MAX_IN_FLIGHT, session_properties=None, **client_options):
+    async def run_all():
+        async with AsyncTrinoClient(max_in_flight, **client_options) as client:
+            return await client.run_queries(queries, session_properties)
+
+    return asyncio.run(run_all())
@@ -0,0 +1,46 @@
+import numpy as np
+
+CONFIDENCE_LEVEL = 0.95
+BOOTSTRAP_RESAMPLES = 2000
+BOOTSTRAP_SEED = 42  # Fixed so rerunning the consolidation gives the same intervals
+OUTLIER_IQR_FACTOR = 1.5  # Tukey fences
+
+
+def summarize_samples(samples, prefix):
+    values = np.asarray([value for value in samples if value is not None], dtype=float)
+
+    if len(values) == 0:
+        return {f"{prefix}_samples": 0}
+
+    ci_low, ci_high = bootstrap_confidence_interval(values)
+    outliers = find_outliers(values)
+
+    return {
+        f"{prefix}_samples": len(values),
+        f"{prefix}_mean": values.mean(),
+        f"{prefix}_median": np.median(values),
+        f"{prefix}_stddev": values.std(ddof=1) if len(values) > 1 else 0.0,
+        f"{prefix}_p95": np.percentile(values, 95),
+        f"{prefix}_ci_low": ci_low,
+        f"{prefix}_ci_high": ci_high,
+        f"{prefix}_outliers": int(outliers.sum()),
+    }
+
+
+def bootstrap_confidence_interval(values, confidence=CONFIDENCE_LEVEL, resamples=BOOTSTRAP_RESAMPLES):
+    if len(values) < 2:
+        return values.mean(), values.mean()
+
+    rng = np.random.default_rng(BOOTSTRAP_SEED)
+    resampled = rng.choice(values, size=(resamples, len(values)), replace=True)
+    means = resampled.mean(axis=1)
+    tail = (1 - confidence) / 2 * 100
+
+    return np.percentile(means, tail), np.percentile(means, 100 - tail)
+
+
+def find_outliers(values):
+    q1, q3 = np.percentile(values, [25, 75])
+    fence = OUTLIER_IQR_FACTOR * (q3 - q1)
+
+    return (values < q1 - fence) | (values > q3 + fence)
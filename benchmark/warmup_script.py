@@ -1,13 +1,24 @@
 import os
+import time
+import pandas as pd
+import numpy as np
 import run_trino_query
 import concurrent.futures
+import itertools
+import query_reader
 
-def execute_queries_from_file(sql_dir, filename):
-    with open(os.path.join(sql_dir, filename), "r") as file:
-        queries = file.read().split("-- QUERY: ")
-        results = run_in_parallel(queries)
+WARMUP_QUERIES_PER_FILE = 11
+WARMUP_MODE = "adaptive"  # "fixed" runs the first WARMUP_QUERIES_PER_FILE queries of each 100% file
+PROBE_WINDOW = 5  # Recent latencies the coefficient of variation is computed over
+PROBE_CV_THRESHOLD = 0.05  # A probe is warm once the CV of its window drops below this
+PROBE_MAX_ITERATIONS = 50
+PROBE_TIME_BUDGET_SEC = 120  # Per probe query
+WARMUP_TIME_BUDGET_SEC = 3600  # For the whole warm-up, shared out between the models
+WARMUP_CURVE_FILE = os.path.join("results", "warmup_curve.csv")
 
-    return results
+def execute_queries_from_file(sql_dir, filename):
+    queries = query_reader.read_queries(os.path.join(sql_dir, filename))
+    return run_in_parallel(itertools.islice(queries, WARMUP_QUERIES_PER_FILE))
 
 
 def run_in_parallel(queries):
@@ -15,17 +26,10 @@ def run_in_parallel(queries):
     results = []
     
     with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        for index, q in enumerate(queries[1:]):  # Skip the header
-            query_id_line, query_body = q.strip().split("\n", 1)
-            query_id = query_id_line.strip()
-            query_type = "MATCH_RECOGNIZE" if "MATCH_RECOGNIZE" in query_body.upper() else "REGEX"
-                    
+        for query_id, query_type, query_body in queries:
             future_to_query[executor.submit(
                     run_trino_query.run_query, 
                         query_body, query_id, query_type)] = (query_id, query_body)
-            
-            if index == 10:
-                break
         
         for future in concurrent.futures.as_completed(future_to_query):
             query_id, _ = future_to_query[future]
@@ -43,16 +47,9 @@ def run_in_parallel(queries):
 def run_and_record_queries(queries):
     results = []
     
-    for index, q in enumerate(queries[1:]):  # Skip the header
-        query_id_line, query_body = q.strip().split("\n", 1)
-        query_id = query_id_line.strip()
-        query_type = "MATCH_RECOGNIZE" if "MATCH_RECOGNIZE" in query_body.upper() else "REGEX"
-                
+    for query_id, query_type, query_body in itertools.islice(queries, WARMUP_QUERIES_PER_FILE):
         result = run_trino_query.run_query(query_body, query_id, query_type)
         results.append(result)
-                
-        if index == 10:
-            break
         
     return results
 
@@ -65,10 +62,14 @@ def find_target_sql_file(model_num, sql_dir):
     return None
 
 
-def run_warmup_script():
+def run_warmup_script(queries_dir="data/queries"):
+    if WARMUP_MODE == "adaptive":
+        run_adaptive_warmup(queries_dir)
+        return
+
     print("Running warmup script...")
-    for model_num in range(0, 10):
-        sql_dir = f"data/queries/model{model_num}"
+    for model_num in range(0, 16):
+        sql_dir = os.path.join(queries_dir, f"model{model_num}")
         
         filename = find_target_sql_file(model_num, sql_dir)
             
@@ -79,4 +80,105 @@ def run_warmup_script():
         else:
             print(f"No file starting with model{model_num} and ending with 100.sql found in {sql_dir}")
             
-    print("Warmup script completed.")
\ No newline at end of file
+    print("Warmup script completed.")
+
+
+def run_adaptive_warmup(queries_dir):
+    print("Running adaptive warmup...")
+    deadline = time.time() + WARMUP_TIME_BUDGET_SEC
+    curve = []
+
+    model_dirs = []
+    for model_num in range(0, 16):
+        sql_dir = os.path.join(queries_dir, f"model{model_num}")
+        if os.path.isdir(sql_dir):
+            model_dirs.append((model_num, sql_dir))
+        else:
+            print(f"No query directory {sql_dir}, skipping model{model_num}")
+
+    for index, (model_num, sql_dir) in enumerate(model_dirs):
+        # An equal share of what is left, so time an early model does not need goes to the
+        # later ones, and the last models are still warmed when early ones are slow
+        model_deadline = time.time() + (deadline - time.time()) / (len(model_dirs) - index)
+
+        for filename in sorted(os.listdir(sql_dir)):
+            if not filename.endswith(".sql"):
+                continue
+
+            for query_id, query_type, query_body in find_probe_queries(os.path.join(sql_dir, filename)):
+                if time.time() >= model_deadline:
+                    break
+
+                probe_curve = warm_until_stable(query_body, query_id, query_type, model_deadline)
+                for row in probe_curve:
+                    row["file"] = filename
+
+                curve.extend(probe_curve)
+                last = probe_curve[-1] if probe_curve else {}
+                print(f"{filename} [{query_type}] tag={query_id}: "
+                      f"{len(probe_curve)} runs, cv={last.get('cv', float('nan')):.3f}, "
+                      f"{'stable' if last.get('stable') else 'not stable'}")
+
+        if time.time() >= model_deadline:
+            print(f"Warmup time budget for model{model_num} exhausted.")
+
+    write_warmup_curve(curve)
+    print("Adaptive warmup completed.")
+
+
+def find_probe_queries(file_path):
+    # The first query of each declared type stands in for the whole file
+    probes = {}
+    for query_id, query_type, query_body in query_reader.read_queries(file_path):
+        probes.setdefault(query_type, (query_id, query_type, query_body))
+
+    return list(probes.values())
+
+
+def warm_until_stable(query_body, query_id, query_type, deadline):
+    probe_deadline = min(deadline, time.time() + PROBE_TIME_BUDGET_SEC)
+    latencies = []
+    curve = []
+
+    for iteration in range(1, PROBE_MAX_ITERATIONS + 1):
+        result = run_trino_query.run_query(query_body, query_id, query_type)
+        if result["status"] != "FINISHED":
+            break
+
+        latency = result["elapsed_millis"]
+        if latency is None:
+            latency = result["direct_execution_time_sec"] * 1000
+
+        latencies.append(latency)
+        cv = coefficient_of_variation(latencies[-PROBE_WINDOW:])
+        stable = len(latencies) >= PROBE_WINDOW and cv < PROBE_CV_THRESHOLD
+
+        curve.append({
+            "query_tag": query_id,
+            "query_type": query_type,
+            "iteration": iteration,
+            "latency_millis": latency,
+            "cv": cv,
+            "stable": stable,
+        })
+
+        if stable or time.time() >= probe_deadline:
+            break
+
+    return curve
+
+
+def coefficient_of_variation(values):
+    if len(values) < 2:
+        return float("inf")
+
+    values = np.asarray(values, dtype=float)
+    mean = values.mean()
+
+    return values.std(ddof=1) / mean if mean > 0 else float("inf")
+
+
+def write_warmup_curve(curve):
+    os.makedirs(os.path.dirname(WARMUP_CURVE_FILE), exist_ok=True)
+    pd.DataFrame(curve).to_csv(WARMUP_CURVE_FILE, index=False)
+    print(f"Warmup curve written to {WARMUP_CURVE_FILE}")
@@ -0,0 +1,147 @@
+import glob
+import hashlib
+import os
+import shutil
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+CSV_DELIMITER = ','  # Adjust if needed
+PARQUET_DIR = 'data/parquet'  # One directory per table, mounted into the Trino container
+NUM_BUCKETS = 8  # Files per table, each case lands in exactly one of them
+READ_BLOCK_SIZE = 64 * 1024 * 1024  # Bytes read from the CSV per batch
+ROW_GROUP_SIZE = 128 * 1024  # Rows per Parquet row group
+COMPRESSION = 'zstd'
+TRINO_CATALOG = 'parquet'
+TRINO_SCHEMA = 'public'
+CONTAINER_PARQUET_DIR = '/data/parquet'  # Where PARQUET_DIR is mounted inside the Trino container
+
+TRINO_TYPES = {
+    pa.int8(): 'TINYINT',
+    pa.int16(): 'SMALLINT',
+    pa.int32(): 'INTEGER',
+    pa.int64(): 'BIGINT',
+    pa.float32(): 'REAL',
+    pa.float64(): 'DOUBLE',
+    pa.bool_(): 'BOOLEAN',
+    pa.string(): 'VARCHAR',
+    pa.large_string(): 'VARCHAR',
+}
+
+
+def main():
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    table_definitions = []
+
+    for model_num in range(0, 16):
+        pattern = f"data/models/model{model_num}/model{model_num}_*.csv"
+
+        for file_path in sorted(glob.glob(pattern)):
+            table_name = os.path.splitext(os.path.basename(file_path))[0]
+            schema = export_table(file_path, table_name)
+            table_definitions.append(create_table_statement(table_name, schema))
+
+    ddl_file = os.path.join(PARQUET_DIR, 'create_tables.sql')
+    with open(ddl_file, 'w') as output_file:
+        output_file.write(f"CREATE SCHEMA IF NOT EXISTS {TRINO_CATALOG}.{TRINO_SCHEMA};\n\n")
+        output_file.write("\n\n".join(table_definitions) + "\n")
+
+    print(f"Exported {len(table_definitions)} tables, table definitions written to {ddl_file}.")
+
+
+def export_table(csv_file_path, table_name):
+    table_dir = os.path.join(PARQUET_DIR, table_name)
+    staging_dir = os.path.join(PARQUET_DIR, f".{table_name}_unsorted")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+
+    # First pass streams the CSV and scatters each batch over its case buckets,
+    # so only one batch is held in memory at a time
+    schema = split_into_buckets(csv_file_path, staging_dir)
+
+    # Second pass sorts one bucket at a time by (case_id, position)
+    shutil.rmtree(table_dir, ignore_errors=True)
+    os.makedirs(table_dir)
+    total_rows = 0
+
+    for bucket in range(NUM_BUCKETS):
+        bucket_file = bucket_file_name(staging_dir, bucket)
+        if not os.path.exists(bucket_file):
+            continue
+
+        bucket_table = pq.read_table(bucket_file)
+        bucket_table = bucket_table.sort_by([('case_id', 'ascending'), ('position', 'ascending')])
+        pq.write_table(
+            bucket_table, bucket_file_name(table_dir, bucket),
+            row_group_size=ROW_GROUP_SIZE, compression=COMPRESSION)
+        total_rows += bucket_table.num_rows
+
+    shutil.rmtree(staging_dir)
+    print(f"Exported {csv_file_path} to {table_dir}: {total_rows} rows in {NUM_BUCKETS} buckets.")
+
+    return schema
+
+
+def split_into_buckets(csv_file_path, output_dir):
+    reader = pa_csv.open_csv(
+        csv_file_path,
+        read_options=pa_csv.ReadOptions(block_size=READ_BLOCK_SIZE),
+        parse_options=pa_csv.ParseOptions(delimiter=CSV_DELIMITER))
+    writers = {}
+
+    try:
+        for batch in reader:
+            buckets = case_buckets(batch.column(batch.schema.get_field_index('case_id')))
+
+            for bucket in np.unique(buckets):
+                if bucket not in writers:
+                    writers[bucket] = pq.ParquetWriter(bucket_file_name(output_dir, bucket), reader.schema)
+
+                writers[bucket].write_batch(batch.filter(pa.array(buckets == bucket)))
+
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return reader.schema
+
+
+def case_buckets(case_ids):
+    # Same MD5-based bucketing as the loader's case_bucket column
+    unique_ids = pc.unique(case_ids)
+    unique_buckets = np.array([
+        int(hashlib.md5(str(case_id).encode()).hexdigest()[:8], 16) % NUM_BUCKETS
+        for case_id in unique_ids.to_pylist()])
+
+    indices = pc.index_in(case_ids, value_set=unique_ids).to_numpy(zero_copy_only=False)
+    return unique_buckets[indices]
+
+
+def bucket_file_name(directory, bucket):
+    return os.path.join(directory, f"bucket_{bucket:05d}.parquet")
+
+
+def create_table_statement(table_name, schema):
+    columns = ',\n    '.join(f'"{field.name}" {trino_type(field.type)}' for field in schema)
+
+    return (
+        f"CREATE TABLE IF NOT EXISTS {TRINO_CATALOG}.{TRINO_SCHEMA}.{table_name} (\n"
+        f"    {columns}\n"
+        f")\n"
+        f"WITH (\n"
+        f"    external_location = 'file://{CONTAINER_PARQUET_DIR}/{table_name}',\n"
+        f"    format = 'PARQUET'\n"
+        f");")
+
+
+def trino_type(arrow_type):
+    if pa.types.is_timestamp(arrow_type):
+        return 'TIMESTAMP(3)'
+
+    return TRINO_TYPES.get(arrow_type, 'VARCHAR')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import csv
 import psycopg2
+import psycopg2.pool
+import concurrent.futures
 from io import StringIO
 import glob
+import hashlib
+import json
 import os
+import re
+import sys
+import time
+from datetime import datetime
 
 POSTGRES_HOST = 'localhost'
 POSTGRES_PORT = '5432'
@@ -11,34 +19,72 @@ POSTGRES_USER = 'trino'
 POSTGRES_PASSWORD = 'secret'
 CSV_DELIMITER = ','  # Adjust if needed
 CSV_HAS_HEADER = True  # Set to True if your CSV has a header row
+COPY_MODE = 'streaming'  # 'streaming' pipes the file in chunks, 'buffered' reads it whole
+COPY_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes handed to COPY per read in streaming mode
+PARALLEL_LOAD = True  # Load tables concurrently over a connection pool
+LOAD_WORKERS = 4  # Number of tables loaded at the same time
+LOAD_RETRIES = 3  # Attempts per table before giving up on it
+LOAD_RETRY_DELAY = 5  # Seconds to wait between attempts
+INFER_SCHEMA = True  # Detect INTEGER/TIMESTAMP columns instead of loading everything as TEXT
+SCHEMA_SAMPLE_ROWS = 10000  # Rows inspected per file when inferring types, None scans the whole file
+CREATE_CASE_INDEX = True  # Build a (case_id, position) index and ANALYZE after the COPY
+CLUSTER_BY_CASE = False  # Also physically reorder the table by the (case_id, position) index
+ENCODE_ACTIVITIES = False  # Replace the activity text with an integer activity_id from a per-model dictionary
+ACTIVITY_COLUMN = 'activity'
+ACTIVITY_DICTIONARY_FILE = 'activities.csv'  # Written next to the model CSVs for the query generator
+BUILD_TRACE_TABLES = False  # Materialize {table}_traces(case_id, full_trace) for the regex queries
+CHARACTER_TRACES = False  # Write one codepoint per activity without separators (needs ENCODE_ACTIVITIES)
+ACTIVITY_CODEPOINT_BASE = 0xE000  # Must match regexp_translator.ACTIVITY_CODEPOINT_BASE
+INCREMENTAL_LOAD = True  # Skip files whose fingerprint is unchanged and swap changed ones in atomically
+LOAD_MANIFEST_TABLE = 'load_manifest'
+SUBSET_MODE = 'tables'  # 'tables' loads every percentage file, 'views' loads the 100% log once per model
+PERCENT_RANGE = range(10, 101, 10)
+CASE_BUCKET_COLUMN = 'case_bucket'
+# Strict subsets of what PostgreSQL accepts for BIGINT and TIMESTAMP, without the forms
+# Python also parses (1_000, padded or non-ASCII digits, time zone offsets)
+INTEGER_PATTERN = re.compile(r'[+-]?[0-9]+')
+TIMESTAMP_PATTERN = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}([ T][0-9]{2}:[0-9]{2}(:[0-9]{2}(\.[0-9]{1,6})?)?)?')
+BIGINT_RANGE = (-2**63, 2**63 - 1)
+# Deterministic 0-99 bucket per case, stable across PostgreSQL versions (unlike hashtext)
+CASE_BUCKET_EXPRESSION = "(('x' || SUBSTR(MD5(case_id::TEXT), 1, 8))::BIT(32)::BIGINT % 100)::SMALLINT"
 
 
 def main():
+    all_csv_files = find_csv_files()
+    csv_files = all_csv_files
+
+    if INCREMENTAL_LOAD:
+        csv_files = find_changed_files(all_csv_files)
+
+    if ENCODE_ACTIVITIES:
+        widened_dictionaries = build_activity_dictionaries(csv_files)
+
+        # Unchanged tables of these models keep trace tables padded to the old code width
+        if INCREMENTAL_LOAD and BUILD_TRACE_TABLES and not CHARACTER_TRACES and widened_dictionaries:
+            csv_files = add_widened_tables(all_csv_files, csv_files, widened_dictionaries)
+
+    if PARALLEL_LOAD:
+        failed_tables = load_in_parallel(csv_files, LOAD_WORKERS)
+
+        # A non-zero exit status, so scripts chaining the load do not go on with missing tables
+        if failed_tables:
+            sys.exit(1)
+        return
+
     conn = None
+    failed = False
     
     try:
-        conn = psycopg2.connect(
-            host=POSTGRES_HOST,
-            port=POSTGRES_PORT,
-            dbname=POSTGRES_DB,
-            user=POSTGRES_USER,
-            password=POSTGRES_PASSWORD
-        )
-
-        conn.autocommit = False
+        conn = connect()
         print("Connected to PostgreSQL database.")
 
-        for model_num in range(0, 16):
-            pattern = f"data/models/model{model_num}/model{model_num}_*.csv"
-            matching_files = glob.glob(pattern)
-            
-            
-            for file_path in matching_files:
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                load_model_to_database(conn, file_path, base_name)
+        for file_path, table_name, fingerprint in csv_files:
+            if not load_model_to_database(conn, file_path, table_name, fingerprint):
+                failed = True
 
     except psycopg2.Error as e:
         print(f"Error connecting to or interacting with PostgreSQL: {e}")
+        failed = True
         if conn:
             conn.rollback()
             print("Transaction rolled back due to error.")
@@ -48,10 +94,205 @@ def main():
             conn.close()
             print("PostgreSQL connection closed.")
 
+    if failed:
+        sys.exit(1)
+
+
+def connect():
+    conn = psycopg2.connect(
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT,
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD
+    )
+
+    conn.autocommit = False
+    return conn
+
+
+def find_csv_files():
+    csv_files = []
+
+    for model_num in range(0, 16):
+        if SUBSET_MODE == 'views':
+            pattern = f"data/models/model{model_num}/model{model_num}_*_100.csv"
+        else:
+            pattern = f"data/models/model{model_num}/model{model_num}_*.csv"
+        
+        for file_path in glob.glob(pattern):
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            if SUBSET_MODE == 'views':
+                base_name = f"{base_name.rsplit('_', 1)[0]}_full"
+
+            csv_files.append((file_path, base_name, None))
+
+    return csv_files
+
+
+def find_changed_files(csv_files):
+    conn = connect()
+    cursor = conn.cursor()
+    changed_files = []
+
+    try:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_MANIFEST_TABLE} (
+            table_name TEXT PRIMARY KEY,
+            file_path TEXT NOT NULL,
+            file_size BIGINT NOT NULL,
+            file_mtime DOUBLE PRECISION NOT NULL,
+            content_hash TEXT NOT NULL,
+            loaded_at TIMESTAMP NOT NULL DEFAULT now()
+        );
+        """)
+        # Manifests from before the options were recorded match no options hash, so every table reloads once
+        cursor.execute(f"ALTER TABLE {LOAD_MANIFEST_TABLE} ADD COLUMN IF NOT EXISTS options_hash TEXT NOT NULL DEFAULT '';")
+        cursor.execute(f"SELECT table_name, file_size, file_mtime, content_hash, options_hash FROM {LOAD_MANIFEST_TABLE};")
+        manifest = {row[0]: row[1:] for row in cursor.fetchall()}
+        options_hash = load_options_hash()
+
+        for file_path, table_name, _ in csv_files:
+            file_stat = os.stat(file_path)
+            recorded = manifest.get(table_name)
+
+            # A table built with other load options has other columns or companion tables
+            if recorded and recorded[3] != options_hash:
+                print(f"Reloading {table_name}: the load options changed since it was built.")
+                recorded = None
+
+            if recorded and recorded[0] == file_stat.st_size and recorded[1] == file_stat.st_mtime:
+                print(f"Skipping {table_name}: {file_path} is unchanged.")
+                continue
+
+            content_hash = hash_file(file_path)
+            if recorded and recorded[0] == file_stat.st_size and recorded[2] == content_hash:
+                # Touched but identical, only refresh the recorded mtime
+                cursor.execute(
+                    f"UPDATE {LOAD_MANIFEST_TABLE} SET file_mtime = %s WHERE table_name = %s;",
+                    (file_stat.st_mtime, table_name))
+                print(f"Skipping {table_name}: {file_path} has the same content.")
+                continue
+
+            fingerprint = (file_stat.st_size, file_stat.st_mtime, content_hash)
+            changed_files.append((file_path, table_name, fingerprint))
+
+        conn.commit()
+
+    finally:
+        cursor.close()
+        conn.close()
+
+    print(f"{len(changed_files)}/{len(csv_files)} files are new or changed.")
+    return changed_files
+
+
+def load_options_hash():
+    # Every option that changes the tables a load builds, not just how fast it builds them
+    options = {
+        'INFER_SCHEMA': INFER_SCHEMA,
+        'ENCODE_ACTIVITIES': ENCODE_ACTIVITIES,
+        'BUILD_TRACE_TABLES': BUILD_TRACE_TABLES,
+        'CHARACTER_TRACES': CHARACTER_TRACES,
+        'ACTIVITY_CODEPOINT_BASE': ACTIVITY_CODEPOINT_BASE,
+        'CREATE_CASE_INDEX': CREATE_CASE_INDEX,
+        'CLUSTER_BY_CASE': CLUSTER_BY_CASE,
+        'SUBSET_MODE': SUBSET_MODE,
+    }
+
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+def hash_file(file_path):
+    file_hash = hashlib.sha256()
+
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(COPY_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def load_in_parallel(csv_files, max_workers):
+    connection_pool = psycopg2.pool.ThreadedConnectionPool(
+        1, max_workers,
+        host=POSTGRES_HOST,
+        port=POSTGRES_PORT,
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD
+    )
+    print(f"Connected to PostgreSQL database with a pool of {max_workers} connections.")
+
+    future_to_table = {}
+    failed_tables = []
+    start_time = time.time()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for file_path, table_name, fingerprint in csv_files:
+                future_to_table[executor.submit(
+                        load_table_with_retries,
+                            connection_pool, file_path, table_name, fingerprint)] = table_name
+
+            for future in concurrent.futures.as_completed(future_to_table):
+                table_name = future_to_table[future]
+
+                try:
+                    if not future.result():
+                        failed_tables.append(table_name)
+
+                except Exception as exc:
+                    print(f"Table {table_name} failed with exception: {exc}")
+                    failed_tables.append(table_name)
+
+    finally:
+        connection_pool.closeall()
+        print("PostgreSQL connection pool closed.")
+
+    print(f"Loaded {len(csv_files) - len(failed_tables)}/{len(csv_files)} tables "
+          f"in {time.time() - start_time:.2f}s.")
+    
+    if failed_tables:
+        print(f"Failed tables: {', '.join(sorted(failed_tables))}")
+
+    return failed_tables
+
+
+def load_table_with_retries(connection_pool, file_path, table_name, fingerprint=None):
+    for attempt in range(1, LOAD_RETRIES + 1):
+        conn = connection_pool.getconn()
+        conn.autocommit = False
+        broken = False
+
+        try:
+            if load_model_to_database(conn, file_path, table_name, fingerprint):
+                return True
+
+        except psycopg2.Error as e:
+            print(f"Error loading {table_name}: {e}")
+            broken = conn.closed != 0
+            if not broken:
+                conn.rollback()
+
+        finally:
+            connection_pool.putconn(conn, close=broken)
+
+        if attempt < LOAD_RETRIES:
+            print(f"Retrying {table_name} ({attempt}/{LOAD_RETRIES}) in {LOAD_RETRY_DELAY}s...")
+            time.sleep(LOAD_RETRY_DELAY)
+
+    print(f"Giving up on {table_name} after {LOAD_RETRIES} attempts.")
+    return False
+
 
-def create_table(conn, table_name, column_names):
+def create_table(conn, table_name, column_names, column_types=None, generated_columns=None):
     cursor = conn.cursor()
-    columns = ', '.join([f"{name} TEXT" for name in column_names])
+    column_types = column_types or {}
+    columns = ', '.join([f"{name} {column_types.get(name, 'TEXT')}" for name in column_names])
+
+    for name, (column_type, expression) in (generated_columns or {}).items():
+        columns += f", {name} {column_type} GENERATED ALWAYS AS ({expression}) STORED"
 
     create_table_query = f"""
     CREATE TABLE IF NOT EXISTS {table_name} (
@@ -65,6 +306,265 @@ def create_table(conn, table_name, column_names):
     print(f"Table {table_name} created successfully.")
 
 
+def infer_column_types(csv_file_path, column_names, delimiter, sample_rows):
+    candidates = {name: {'BIGINT', 'TIMESTAMP'} for name in column_names}
+    seen_values = {name: False for name in column_names}
+
+    with open(csv_file_path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=delimiter)
+        next(csv_reader, None)  # Skip the header row
+
+        for row_num, row in enumerate(csv_reader):
+            if sample_rows is not None and row_num >= sample_rows:
+                break
+
+            for name, value in zip(column_names, row):
+                if value == '' or not candidates[name]:
+                    continue
+
+                seen_values[name] = True
+                if 'BIGINT' in candidates[name] and not _is_integer(value):
+                    candidates[name].discard('BIGINT')
+
+                if 'TIMESTAMP' in candidates[name] and not _is_timestamp(value):
+                    candidates[name].discard('TIMESTAMP')
+
+    column_types = {}
+    for name in column_names:
+        if not seen_values[name]:
+            column_types[name] = 'TEXT'
+        elif 'BIGINT' in candidates[name]:
+            column_types[name] = 'BIGINT'
+        elif 'TIMESTAMP' in candidates[name]:
+            column_types[name] = 'TIMESTAMP'
+        else:
+            column_types[name] = 'TEXT'
+
+    return column_types
+
+
+def _is_integer(value):
+    if not INTEGER_PATTERN.fullmatch(value):
+        return False
+
+    return BIGINT_RANGE[0] <= int(value) <= BIGINT_RANGE[1]
+
+
+def _is_timestamp(value):
+    if not TIMESTAMP_PATTERN.fullmatch(value):
+        return False
+
+    try:
+        datetime.fromisoformat(value)  # Rejects impossible dates such as 2024-02-30
+        return True
+    except ValueError:
+        return False
+
+
+def dictionary_table_name(table_name):
+    model_prefix = table_name.rsplit('_', 1)[0]
+    return f"{model_prefix}_activities"
+
+
+def build_activity_dictionaries(csv_files):
+    widened_dictionaries = set()
+    files_per_model = {}
+    for file_path, table_name, _ in csv_files:
+        files_per_model.setdefault(dictionary_table_name(table_name), []).append(file_path)
+
+    conn = connect()
+    cursor = conn.cursor()
+
+    try:
+        for dictionary_table, file_paths in files_per_model.items():
+            activity_names = set()
+            for file_path in file_paths:
+                activity_names.update(read_activity_names(file_path, CSV_DELIMITER))
+
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {dictionary_table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            """)
+            cursor.execute(f"SELECT name, id FROM {dictionary_table};")
+            activity_codes = dict(cursor.fetchall())
+
+            # Existing codes are kept so tables skipped by an incremental reload stay valid
+            new_names = sorted(activity_names - activity_codes.keys())
+            previous_max_code = max(activity_codes.values(), default=0)
+            next_code = previous_max_code + 1
+            new_codes = {name: code for code, name in enumerate(new_names, start=next_code)}
+            activity_codes.update(new_codes)
+
+            cursor.executemany(
+                f"INSERT INTO {dictionary_table} (id, name) VALUES (%s, %s);",
+                [(code, name) for name, code in new_codes.items()])
+            conn.commit()
+
+            dictionary_file = os.path.join(os.path.dirname(file_paths[0]), ACTIVITY_DICTIONARY_FILE)
+            with open(dictionary_file, 'w', newline='') as output_file:
+                csv_writer = csv.writer(output_file)
+                csv_writer.writerow(['id', 'name'])
+                for name, code in sorted(activity_codes.items(), key=lambda item: item[1]):
+                    csv_writer.writerow([code, name])
+
+            print(f"Dictionary {dictionary_table} holds {len(activity_codes)} activities "
+                  f"({len(new_codes)} new).")
+
+            # Trace tables pad codes to the width of the largest one
+            if previous_max_code and len(str(max(activity_codes.values()))) > len(str(previous_max_code)):
+                widened_dictionaries.add(dictionary_table)
+
+    finally:
+        cursor.close()
+        conn.close()
+
+    return widened_dictionaries
+
+
+def add_widened_tables(all_csv_files, csv_files, widened_dictionaries):
+    reloaded_tables = {table_name for _, table_name, _ in csv_files}
+    csv_files = list(csv_files)
+
+    for file_path, table_name, _ in all_csv_files:
+        if table_name in reloaded_tables or dictionary_table_name(table_name) not in widened_dictionaries:
+            continue
+
+        # Reloaded like a changed file, so the staging swap also replaces its views
+        file_stat = os.stat(file_path)
+        csv_files.append((file_path, table_name, (file_stat.st_size, file_stat.st_mtime, hash_file(file_path))))
+        print(f"Reloading {table_name}: the activity code width of {dictionary_table_name(table_name)} grew.")
+
+    return csv_files
+
+
+def read_activity_names(csv_file_path, delimiter):
+    activity_names = set()
+
+    with open(csv_file_path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file, delimiter=delimiter)
+        header = next(csv_reader, None)
+        if not header or ACTIVITY_COLUMN not in header:
+            return activity_names
+
+        activity_index = header.index(ACTIVITY_COLUMN)
+        for row in csv_reader:
+            if len(row) > activity_index and row[activity_index] != '':
+                activity_names.add(row[activity_index])
+
+    return activity_names
+
+
+def encode_activity_column(conn, table_name, column_names, dictionary_table):
+    cursor = conn.cursor()
+    encoded_table = f"{table_name}_encoded"
+
+    select_columns = ', '.join(
+        ["d.id AS activity_id" if name == ACTIVITY_COLUMN else f"t.{name}" for name in column_names])
+
+    cursor.execute(f"DROP TABLE IF EXISTS {encoded_table};")
+    cursor.execute(f"""
+    CREATE TABLE {encoded_table} AS
+    SELECT {select_columns}
+    FROM {table_name} t
+    LEFT JOIN {dictionary_table} d ON d.name = t.{ACTIVITY_COLUMN};
+    """)
+    # The percentage views depend on the table, they are recreated once the load finishes
+    cascade = ' CASCADE' if SUBSET_MODE == 'views' else ''
+    cursor.execute(f"DROP TABLE {table_name}{cascade};")
+    cursor.execute(f"ALTER TABLE {encoded_table} RENAME TO {table_name};")
+    conn.commit()
+    cursor.close()
+    print(f"Table {table_name} encoded against {dictionary_table}.")
+
+
+def build_trace_table(conn, table_name, column_names, dictionary_table):
+    cursor = conn.cursor()
+    trace_table = f"{table_name}_traces"
+
+    separator = ','
+    if CHARACTER_TRACES and ENCODE_ACTIVITIES and ACTIVITY_COLUMN in column_names:
+        trace_activity = f"CHR(activity_id + {ACTIVITY_CODEPOINT_BASE})"
+        separator = ''
+    elif ENCODE_ACTIVITIES and ACTIVITY_COLUMN in column_names:
+        code_width = f"(SELECT LENGTH(MAX(id)::TEXT) FROM {dictionary_table})"
+        trace_activity = f"LPAD(activity_id::TEXT, {code_width}, '0')"
+    else:
+        trace_activity = ACTIVITY_COLUMN
+
+    bucket_column = ''
+    if CASE_BUCKET_COLUMN in column_names:
+        bucket_column = f",\n        MIN({CASE_BUCKET_COLUMN}) AS {CASE_BUCKET_COLUMN}"
+
+    cursor.execute(f"DROP TABLE IF EXISTS {trace_table};")
+    cursor.execute(f"""
+    CREATE TABLE {trace_table} AS
+    SELECT
+        case_id,
+        STRING_AGG({trace_activity}, '{separator}' ORDER BY position) AS full_trace{bucket_column}
+    FROM {table_name}
+    GROUP BY case_id;
+    """)
+    cursor.execute(f"ANALYZE {trace_table};")
+    conn.commit()
+    cursor.close()
+    print(f"Trace table {trace_table} built successfully.")
+
+
+def create_percentage_views(cursor, table_name):
+    model_prefix = table_name.rsplit('_', 1)[0]
+
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_name = %s AND column_name <> %s ORDER BY ordinal_position;",
+        (table_name, CASE_BUCKET_COLUMN))
+    view_columns = ', '.join(row[0] for row in cursor.fetchall())
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (f"{table_name}_traces",))
+    has_traces = cursor.fetchone()[0]
+
+    for percent in PERCENT_RANGE:
+        cursor.execute(f"""
+        CREATE OR REPLACE VIEW {model_prefix}_{percent} AS
+        SELECT {view_columns}
+        FROM {table_name}
+        WHERE {CASE_BUCKET_COLUMN} < {percent};
+        """)
+
+        if has_traces:
+            cursor.execute(f"""
+            CREATE OR REPLACE VIEW {model_prefix}_{percent}_traces AS
+            SELECT case_id, full_trace
+            FROM {table_name}_traces
+            WHERE {CASE_BUCKET_COLUMN} < {percent};
+            """)
+
+    print(f"Created {len(PERCENT_RANGE)} percentage views over {table_name}.")
+
+
+def index_and_analyze_table(conn, table_name, column_names):
+    cursor = conn.cursor()
+
+    if 'case_id' in column_names and 'position' in column_names:
+        index_name = f"{table_name}_case_id_position_idx"
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} (case_id, position);")
+
+        if CLUSTER_BY_CASE:
+            cursor.execute(f"CLUSTER {table_name} USING {index_name};")
+
+    cursor.execute(f"ANALYZE {table_name};")
+    conn.commit()
+    cursor.close()
+    print(f"Table {table_name} indexed and analyzed.")
+
+
+def copy_statement(table_name, delimiter):
+    # Both COPY modes parse the file the same way, so switching modes never changes the data
+    return f"COPY {table_name} FROM STDIN WITH (FORMAT csv, DELIMITER '{delimiter}', NULL '')"
+
+
 def copy_data_from_csv(conn, table_name, csv_file_path, delimiter, has_header):
     cursor = conn.cursor()
 
@@ -75,18 +575,100 @@ def copy_data_from_csv(conn, table_name, csv_file_path, delimiter, has_header):
         data = StringIO(csv_file.read())
 
         try: 
-            cursor.copy_from(data, table_name, sep=delimiter, null='')
+            cursor.copy_expert(copy_statement(table_name, delimiter), data)
             conn.commit()
             print(f"Data from {csv_file_path} loaded into {table_name} successfully.")
+            success = True
 
         except Exception as e:
             print(f"Error loading data: {e}")
             conn.rollback()
+            success = False
     
     cursor.close()
+    return success
+
+
+class ChunkedFileReader:
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+
+        chunk = self.file.read(size)
+        self.bytes_read += len(chunk)
+
+        return chunk
+
+    def readline(self, size=-1):
+        line = self.file.readline(size)
+        self.bytes_read += len(line)
+
+        return line
+
+
+def stream_data_from_csv(conn, table_name, csv_file_path, delimiter, has_header):
+    cursor = conn.cursor()
+
+    with open(csv_file_path, 'rb') as csv_file:
+        if has_header:
+            csv_file.readline()  # Skip the header row
+
+        reader = ChunkedFileReader(csv_file, COPY_CHUNK_SIZE)
+        start_time = time.time()
+
+        try:
+            cursor.copy_expert(copy_statement(table_name, delimiter), reader, size=COPY_CHUNK_SIZE)
+            conn.commit()
+
+            elapsed = max(time.time() - start_time, 1e-9)
+            rows = max(cursor.rowcount, 0)
+            print(
+                f"Data from {csv_file_path} streamed into {table_name}: "
+                f"{rows} rows in {elapsed:.2f}s "
+                f"({rows / elapsed:,.0f} rows/s, {reader.bytes_read / elapsed / 1024**2:,.2f} MB/s)")
+            success = True
+
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            conn.rollback()
+            success = False
+
+    cursor.close()
+    return success
+
+
+def load_model_to_database(conn, file_path, table_name, fingerprint=None):
+    if fingerprint is None:
+        # CREATE TABLE IF NOT EXISTS would keep the rows of an earlier run or a failed attempt
+        # and COPY would append to them. The percentage views are recreated below.
+        drop_tables(conn, [f"{table_name}_traces", f"{table_name}_encoded", table_name],
+                    cascade=SUBSET_MODE == 'views')
+        success = load_table(conn, file_path, table_name, dictionary_table_name(table_name))
+
+        if success and SUBSET_MODE == 'views':
+            cursor = conn.cursor()
+            create_percentage_views(cursor, table_name)
+            conn.commit()
+            cursor.close()
+
+        return success
+
+    staging_table = f"{table_name}_staging"
+    drop_tables(conn, [f"{staging_table}_traces", f"{staging_table}_encoded", staging_table])
 
+    if not load_table(conn, file_path, staging_table, dictionary_table_name(table_name)):
+        return False
 
-def load_model_to_database(conn, file_path, table_name):
+    swap_staging_table(conn, staging_table, table_name, file_path, fingerprint)
+    return True
+
+
+def load_table(conn, file_path, table_name, dictionary_table):
     with open(file_path, 'r') as csv_file:
         csv_reader = csv.reader(csv_file, delimiter=CSV_DELIMITER)
         
@@ -95,13 +677,95 @@ def load_model_to_database(conn, file_path, table_name):
         except StopIteration:
             header = None
 
+    column_types = None
+    generated_columns = None
+    csv_columns = header
+
     if header:
-        create_table(conn, table_name, header)
+        if INFER_SCHEMA:
+            column_types = infer_column_types(file_path, header, CSV_DELIMITER, SCHEMA_SAMPLE_ROWS)
+            print(f"Inferred schema for {table_name}: {column_types}")
+
+        if SUBSET_MODE == 'views':
+            generated_columns = {CASE_BUCKET_COLUMN: ('SMALLINT', CASE_BUCKET_EXPRESSION)}
+
+        create_table(conn, table_name, header, column_types, generated_columns)
+        if generated_columns:
+            header = header + list(generated_columns)
     else:
         print("Warning: No header row found in CSV. Ensure your table schema matches.")
 
-    copy_data_from_csv(conn, table_name, file_path, CSV_DELIMITER, CSV_HAS_HEADER)
+    success = copy_csv(conn, table_name, file_path)
+
+    # Types come from a sample, a later row may not fit them. Retrying would fail the same way.
+    if not success and column_types and any(column_type != 'TEXT' for column_type in column_types.values()):
+        print(f"Falling back to TEXT columns for {table_name}.")
+        drop_tables(conn, [table_name])
+        create_table(conn, table_name, csv_columns, None, generated_columns)
+        success = copy_csv(conn, table_name, file_path)
+
     conn.commit()
 
+    if success and header and ENCODE_ACTIVITIES and ACTIVITY_COLUMN in header:
+        encode_activity_column(conn, table_name, header, dictionary_table)
+
+    if success and header and CREATE_CASE_INDEX:
+        index_and_analyze_table(conn, table_name, header)
+
+    if success and header and BUILD_TRACE_TABLES:
+        build_trace_table(conn, table_name, header, dictionary_table)
+
+    return success
+
+
+def copy_csv(conn, table_name, file_path):
+    if COPY_MODE == 'streaming':
+        return stream_data_from_csv(conn, table_name, file_path, CSV_DELIMITER, CSV_HAS_HEADER)
+
+    return copy_data_from_csv(conn, table_name, file_path, CSV_DELIMITER, CSV_HAS_HEADER)
+
+
+def drop_tables(conn, table_names, cascade=False):
+    cursor = conn.cursor()
+    for table_name in table_names:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}{' CASCADE' if cascade else ''};")
+
+    conn.commit()
+    cursor.close()
+
+
+def swap_staging_table(conn, staging_table, table_name, file_path, fingerprint):
+    cursor = conn.cursor()
+    file_size, file_mtime, content_hash = fingerprint
+
+    # One transaction, so readers see either the old or the new table, never both or none
+    # The percentage views depend on the table, they are recreated below
+    cascade = ' CASCADE' if SUBSET_MODE == 'views' else ''
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name}_traces{cascade};")
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name}{cascade};")
+    cursor.execute(f"ALTER TABLE {staging_table} RENAME TO {table_name};")
+    cursor.execute(
+        f"ALTER INDEX IF EXISTS {staging_table}_case_id_position_idx "
+        f"RENAME TO {table_name}_case_id_position_idx;")
+    cursor.execute(f"ALTER TABLE IF EXISTS {staging_table}_traces RENAME TO {table_name}_traces;")
+    cursor.execute(f"""
+    INSERT INTO {LOAD_MANIFEST_TABLE} (table_name, file_path, file_size, file_mtime, content_hash, options_hash, loaded_at)
+    VALUES (%s, %s, %s, %s, %s, %s, now())
+    ON CONFLICT (table_name) DO UPDATE SET
+        file_path = EXCLUDED.file_path,
+        file_size = EXCLUDED.file_size,
+        file_mtime = EXCLUDED.file_mtime,
+        content_hash = EXCLUDED.content_hash,
+        options_hash = EXCLUDED.options_hash,
+        loaded_at = EXCLUDED.loaded_at;
+    """, (table_name, file_path, file_size, file_mtime, content_hash, load_options_hash()))
+
+    if SUBSET_MODE == 'views':
+        create_percentage_views(cursor, table_name)
+
+    conn.commit()
+    cursor.close()
+    print(f"Table {table_name} swapped in from {staging_table}.")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,38 +1,41 @@
 import pandas as pd
 import re
 import match_recognize_translator as mrt
+import match_recognize_optimizer as mro
 import match_recognize_query as mrq
 import regexp_translator as rt
 import regex_query as rq
+import regex_analyzer
+import signal_query_parser as parser
 import textwrap
 import logging
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 PERCENT_RANGE = range(10, 101, 10)
 DATA_DIR = Path(__file__).parent.parent / 'data' / 'queries'
 CSV_PATH = DATA_DIR / 'signal_queries.csv'
-
-
-regexp_patterns = {
-    "opening_negation": 
-        r"\^\s*NOT\(\s'[^']*?'\s\)|\^\sNOT\(\s'[^']*?'\s\|\s'[^']*?'\s\)\*",
-    "closing_negation": 
-        r"NOT\(\s'[^']*?'\s\)\*\$|NOT\(\s'[^']*?'\s\|\s'[^']*?'\s\)\*\s*\$",
-    "closing_negation_OR": 
-        r"\(\(\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\)\*\s\|\s\(\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\)\)\*\s*\$",
-    "closing_directly_follows_negation": 
-        r"\(\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\*\)\s*\$",
-    "in-directly_follows": 
-        r"\(\s'[^']*?'\s~>\s'[^']*?'\s\)\*",
-    "in-directly_any_follows": 
-        r"\(\s'[^']*?'\sANY\*\s'[^']*?'\s\)\*",
-    "directly_follows_negation": 
-        r"\(\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\*\)\*",
-    "no_consecutive": 
-        r"\(\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\*\s'[^']*?'\sNOT\(\s'[^']*?'\s\)\*\)\*",
-    "In-directly_follows_with_trailing": 
-        r"\(\(\s'[^']*?'\sANY\*\s'[^']*?'\sANY\*\)\s\|\s\(\s'[^']*?'\sANY\*\s'[^']*?'\sANY\*\)\)\*"
+MODELS_DIR = Path(__file__).parent.parent / 'data' / 'models'
+ENCODE_ACTIVITIES = False  # Emit activity_id literals from the loader's per-model activities.csv
+# 'characters' writes every activity as one Unicode codepoint and joins traces without separators.
+# It needs ENCODE_ACTIVITIES, and the loader's CHARACTER_TRACES for TRACE_SOURCE = 'traces'.
+TRACE_ALPHABET = 'delimited'
+TRACE_SOURCE = 'events'  # 'events' aggregates traces per query, 'traces' reads the loader's {table}_traces
+# Where the event tables live, and where the queries against them are written
+TABLE_TARGETS = {
+    'postgresql': ('postgresql.public', DATA_DIR),
+    'parquet': ('parquet.public', DATA_DIR.parent / 'queries_parquet'),
 }
+TABLE_TARGET = 'postgresql'  # 'parquet' reads the files written by export_parquet_files.py
+# Collapse ANY* runs, make ANY* reluctant and prefilter the cases on required activities
+OPTIMIZE_MATCH_RECOGNIZE = False
+REGEX_MODE = 'classic'  # 'linear' emits patterns that match in linear time, see regexp_translator.py
+MODEL_WORKERS = 4  # Processes generating models in parallel, 1 generates them in this process
+# Queries are translated once with these placeholders, then stamped out for every percentage
+QUERY_NUM_PLACEHOLDER = '__QUERY_NUM__'
+TABLE_PLACEHOLDER = '__TABLE_NAME__'
+TRACE_TABLE_PLACEHOLDER = '__TRACE_TABLE__'
+
 
 def main():
     logging.basicConfig(level=logging.INFO)
@@ -42,75 +45,116 @@ def main():
     
     logging.info(f"Loaded {len(unique_models)} unique models from {CSV_PATH}")
     
-    for model_num, model_id in enumerate(unique_models):
-        df_subset = dataFrame[dataFrame['model_id'] == model_id]
-        process_model(model_num, model_id, df_subset)
+    models = [(model_num, model_id, dataFrame[dataFrame['model_id'] == model_id])
+              for model_num, model_id in enumerate(unique_models)]
+
+    if MODEL_WORKERS <= 1:
+        for model in models:
+            process_model(*model)
+
+    else:
+        with ProcessPoolExecutor(MODEL_WORKERS) as executor:
+            for future in [executor.submit(process_model, *model) for model in models]:
+                future.result()
 
 
 def process_model(model_num: int, model_id: str, df_subset: pd.DataFrame):
-    model_dir = DATA_DIR / f"model{model_num}"
+    _, output_dir = TABLE_TARGETS[TABLE_TARGET]
+    model_dir = output_dir / f"model{model_num}"
     model_dir.mkdir(parents=True, exist_ok=True)
+    activity_codes = load_activity_codes(model_num) if ENCODE_ACTIVITIES else None
+
+    # Activity codes differ per model, so translations are only shared within one
+    translation_cache = {}
+    templates = [translate_query(row['signal_query'], activity_codes, translation_cache)
+                 for _, row in df_subset.iterrows()]
+    log_superlinear_patterns(model_num, translation_cache)
     
     for percent in PERCENT_RANGE:
-        process_percent(df_subset, model_num, model_id, percent, model_dir)
+        process_percent(templates, model_num, model_id, percent, model_dir)
 
 
-def process_percent(df_subset: pd.DataFrame, model_num: int, model_id: str, percent: int, model_dir: Path):
-    sql_queries = []
-    table_name = f"postgresql.public.model{model_num}_{model_id}_{percent}"
-    output_file = model_dir / f"model{model_num}_{model_id}_{percent}.sql"
+def log_superlinear_patterns(model_num: int, translation_cache: dict):
+    # One summary per model, the patterns themselves only at DEBUG
+    flagged = 0
+    exponential = 0
+    for signal_query, templates in translation_cache.items():
+        findings = regex_analyzer.find_superlinear_patterns(templates[1])
+        for pattern, issues in findings:
+            logging.debug(f"Regex {pattern!r} for {signal_query!r} can backtrack: {'; '.join(issues)}")
+
+        flagged += bool(findings)
+        exponential += any('exponential' in issue for _, issues in findings for issue in issues)
+
+    if flagged:
+        logging.warning(f"Model {model_num}: {flagged}/{len(translation_cache)} regex queries can backtrack, "
+                        f"{exponential} of them exponentially (details at DEBUG)")
+
+
+def load_activity_codes(model_num: int) -> dict:
+    dictionary_file = MODELS_DIR / f"model{model_num}" / 'activities.csv'
+    dictionary = pd.read_csv(dictionary_file, dtype={'id': int, 'name': str}, keep_default_na=False)
     
-    for query_num, (_, row) in enumerate(df_subset.iterrows()):
-        signal_query = row['signal_query']
-        match_query = find_matches(signal_query)
-
-        if match_query == '':
-            activity = find_activity_in_query(signal_query)
-            regex_query, match_recognize_query = create_queries(activity, query_num, table_name)
-            
-        else:
-            tokenized_query_match_recognize = tokenize_signal_query_match_recognize(match_query)
-            tokenized_query_regex = tokenize_signal_query_regex(match_query)
-            
-            patternTranslator = mrt.MatchRecognizeTranslator(tokenized_query_match_recognize)
-            regexpTranslator = rt.RegexpTranslator(tokenized_query_regex, regexp_patterns)
-            
-            patternTranslator.translate()
-            regexpTranslator.translate()
-            
-            pattern = patternTranslator._format_pattern()
-            definitions = patternTranslator._format_definitions()
-            sequences = regexpTranslator._return_sequences()
-
-            match_recognize_query = mrq.MatchRecognizeQuery(pattern, definitions, query_num, table_name)
-            regex_query = rq.RegexQuery(table_name, sequences, query_num)
-
-        sql_queries.append(match_recognize_query)
-        sql_queries.append(regex_query)
-
-    with open(output_file, 'w') as f:
-        for query in sql_queries:
-            f.write(str(query).strip() + "\n\n")
-
-
-def tokenize_signal_query_regex(match_query):
-    patterns = list(regexp_patterns.values())
-    combined_pattern = r"(" + r"|".join(patterns) + r")"
-    token_pattern = re.compile(combined_pattern, re.VERBOSE)
-
-    tokens = token_pattern.findall(match_query)
+    logging.info(f"Loaded {len(dictionary)} activity codes from {dictionary_file}")
     
-    return [token.strip() for token in tokens if token.strip()]
+    return dict(zip(dictionary['name'], dictionary['id']))
 
 
-def tokenize_signal_query_match_recognize(match_query):
-    token_pattern = re.compile(r"""
-        (
-            \^|\$|\(|\)|\*|\||~>|ANY|NOT|'[^']*'
-        )""", re.VERBOSE)
-    tokens = token_pattern.findall(match_query)
-    
-    return [token.strip() for token in tokens if token.strip()]
+def process_percent(templates: list, model_num: int, model_id: str, percent: int, model_dir: Path):
+    table_prefix, _ = TABLE_TARGETS[TABLE_TARGET]
+    table_name = f"{table_prefix}.model{model_num}_{model_id}_{percent}"
+    trace_table = f"{table_name}_traces"
+    output_file = model_dir / f"model{model_num}_{model_id}_{percent}.sql"
+
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for query_num, query_templates in enumerate(templates):
+            for template in query_templates:
+                query = (template
+                         .replace(QUERY_NUM_PLACEHOLDER, str(query_num))
+                         .replace(TRACE_TABLE_PLACEHOLDER, trace_table)
+                         .replace(TABLE_PLACEHOLDER, table_name))
+                f.write(query + "\n\n")
+
+
+def translate_query(signal_query: str, activity_codes: dict = None, cache: dict = None) -> tuple:
+    if cache is not None and signal_query in cache:
+        return cache[signal_query]
+
+    trace_table = TRACE_TABLE_PLACEHOLDER if TRACE_SOURCE == 'traces' else None
+    match_query = find_matches(signal_query)
+
+    if match_query == '':
+        activity = find_activity_in_query(signal_query)
+        regex_query, match_recognize_query = create_queries(
+            activity, QUERY_NUM_PLACEHOLDER, TABLE_PLACEHOLDER, activity_codes, trace_table, TRACE_ALPHABET)
+        
+    else:
+        query_ast = parser.parse(match_query)
+        
+        pattern_ast = mro.optimize(query_ast) if OPTIMIZE_MATCH_RECOGNIZE else query_ast
+        patternTranslator = mrt.MatchRecognizeTranslator(pattern_ast, activity_codes)
+        regexpTranslator = rt.RegexpTranslator(query_ast, activity_codes, REGEX_MODE, TRACE_ALPHABET)
+        
+        patternTranslator.translate()
+        regexpTranslator.translate()
+        
+        pattern = patternTranslator._format_pattern()
+        definitions = patternTranslator._format_definitions()
+        sequences = regexpTranslator._return_sequences()
+
+        candidate_conditions = patternTranslator._format_candidate_conditions() if OPTIMIZE_MATCH_RECOGNIZE else None
+
+        match_recognize_query = mrq.MatchRecognizeQuery(pattern, definitions, QUERY_NUM_PLACEHOLDER, TABLE_PLACEHOLDER,
+                                                        candidate_conditions)
+        code_width = rt.activity_code_width(activity_codes) if activity_codes is not None else None
+        regex_query = rq.RegexQuery(TABLE_PLACEHOLDER, sequences, QUERY_NUM_PLACEHOLDER, code_width, trace_table,
+                                    TRACE_ALPHABET)
+
+    templates = (str(match_recognize_query).strip(), str(regex_query).strip())
+    if cache is not None:
+        cache[signal_query] = templates
+
+    return templates
 
 
 def find_matches(signal_query):
@@ -134,26 +178,55 @@ def find_activity_in_query(signal_query):
     return activity_pattern.findall(signal_query)[0]
 
 
-def create_queries(activity, query_num, table_name):
-    regex_query = textwrap.dedent(f"""
-        -- QUERY: {query_num}
-        -- TYPE: regex
-        WITH raw_traces AS (
+def create_queries(activity, query_num, table_name, activity_codes=None, trace_table=None, trace_alphabet='delimited'):
+    separator = rq.TRACE_SEPARATORS[trace_alphabet]
+    if activity_codes is None:
+        trace_activity = rq.trace_activity_expression()
+        regex_activity = activity
+        definition = f"activity = {activity}"
+    else:
+        activity_name = activity.strip("'")
+        trace_activity = rq.trace_activity_expression(rt.activity_code_width(activity_codes), trace_alphabet)
+        if trace_alphabet == 'characters':
+            regex_activity = f"'{rt.format_activity_character(activity_name, activity_codes)}'"
+        else:
+            regex_activity = f"'{rt.format_activity_code(activity_name, activity_codes)}'"
+        definition = f"activity_id = {activity_codes.get(activity_name, 0)}"
+    
+    if trace_table is None:
+        regex_query = textwrap.dedent(f"""
+            -- QUERY: {query_num}
+            -- TYPE: regex
+            -- SOURCE: events
+            WITH raw_traces AS (
+                SELECT
+                    case_id,
+                    ARRAY_JOIN(ARRAY_AGG({trace_activity} ORDER BY position), '{separator}') AS full_trace
+                FROM
+                    {table_name}
+                GROUP BY
+                    case_id
+            )
+            SELECT
+                COUNT(case_id)
+            FROM
+                raw_traces rt
+            WHERE
+                regexp_like(full_trace, {regex_activity})
+            """)
+
+    else:
+        regex_query = textwrap.dedent(f"""
+            -- QUERY: {query_num}
+            -- TYPE: regex
+            -- SOURCE: traces
             SELECT
-                case_id,
-                ARRAY_JOIN(ARRAY_AGG(activity ORDER BY position), ',') AS full_trace
+                COUNT(case_id)
             FROM
-                {table_name}
-            GROUP BY
-                case_id
-        )
-        SELECT
-            COUNT(case_id)
-        FROM
-            raw_traces rt
-        WHERE
-            regexp_like(full_trace, {activity})
-        """)
+                {trace_table} rt
+            WHERE
+                regexp_like(full_trace, {regex_activity})
+            """)
         
     match_recognize_query = textwrap.dedent(f"""
         -- QUERY: {query_num}
@@ -165,7 +238,7 @@ def create_queries(activity, query_num, table_name):
             ORDER BY position
             ONE ROW PER MATCH
             PATTERN (^ANY* A ANY*$)
-            DEFINE A AS activity = {activity})
+            DEFINE A AS {definition})
     """)
     
     return regex_query, match_recognize_query
@@ -0,0 +1,134 @@
+import signal_query_parser as parser
+
+# The generated queries only COUNT the cases with a match, and after optimize() every
+# pattern is anchored with ^ and $, so a match always spans the whole case. Which rows
+# a quantifier prefers is then invisible: greedy and reluctant find the same cases.
+
+
+def optimize(query_ast):
+    node = _simplify(_unwrap(query_ast))
+    items = [parser.Group(node)] if isinstance(node, parser.Alternation) else _concat_items(node)
+
+    # Explicit anchors let the leading and trailing ANY* merge with runs in the query
+    if not parser.is_anchored(node, parser.Start):
+        items = [parser.Start(), parser.Star(parser.AnyActivity())] + items
+    if not parser.is_anchored(node, parser.End):
+        items = items + [parser.Star(parser.AnyActivity()), parser.End()]
+
+    node = _simplify(parser.Concat(tuple(items)))
+
+    # PATTERN needs the outer parentheses
+    return parser.Group(_make_reluctant(node))
+
+
+def _unwrap(node):
+    while isinstance(node, parser.Group):
+        node = node.node
+
+    return node
+
+
+def _concat_items(node):
+    return list(node.items) if isinstance(node, parser.Concat) else [node]
+
+
+def _is_any_run(node):
+    return isinstance(node, parser.Star) and isinstance(node.node, parser.AnyActivity)
+
+
+def _simplify(node):
+    if isinstance(node, parser.Follows):
+        return parser.Star(parser.AnyActivity())
+
+    if isinstance(node, parser.Group):
+        inner = _simplify(node.node)
+        # Parentheses only matter around sequences and alternatives
+        return parser.Group(inner) if isinstance(inner, (parser.Concat, parser.Alternation)) else inner
+
+    if isinstance(node, parser.Star):
+        inner = _simplify(node.node)
+        return parser.Star(inner.node if isinstance(inner, parser.Star) else inner)
+
+    if isinstance(node, parser.Concat):
+        items = []
+        for item in node.items:
+            item = _simplify(item)
+            # A parenthesised sequence inside a sequence needs no parentheses
+            items += _concat_items(_unwrap(item)) if isinstance(_unwrap(item), parser.Concat) else [item]
+
+        items = _collapse_any_runs(items)
+        return items[0] if len(items) == 1 else parser.Concat(tuple(items))
+
+    if isinstance(node, parser.Alternation):
+        return parser.Alternation(tuple(_simplify(branch) for branch in node.branches))
+
+    return node
+
+
+def _collapse_any_runs(items):
+    # ANY* N ANY* matches any sequence whenever N can match the empty one, so N and the
+    # second ANY* are dropped
+    collapsed = []
+
+    for item in items:
+        if _is_any_run(item):
+            run_index = _last_absorbing_run(collapsed)
+            if run_index is not None:
+                del collapsed[run_index + 1:]
+                continue
+
+        collapsed.append(item)
+
+    return collapsed
+
+
+def _last_absorbing_run(items):
+    for index in range(len(items) - 1, -1, -1):
+        if _is_any_run(items[index]):
+            return index
+
+        if not _nullable(items[index]):
+            return None
+
+    return None
+
+
+def _nullable(node):
+    # Anchors count as not nullable, dropping one would let the match start or end elsewhere
+    if isinstance(node, (parser.Star, parser.Follows)):
+        return True
+
+    if isinstance(node, parser.Group):
+        return _nullable(node.node)
+
+    if isinstance(node, parser.Concat):
+        return all(_nullable(item) for item in node.items)
+
+    if isinstance(node, parser.Alternation):
+        return any(_nullable(branch) for branch in node.branches)
+
+    return False
+
+
+def _make_reluctant(node, before_end=False):
+    # ANY* accepts every row, so a greedy one runs to the end of the case and backs off
+    # row by row to find what follows it. Only a final ANY*$ has to reach the end anyway.
+    if _is_any_run(node):
+        return parser.Star(node.node, reluctant=not before_end)
+
+    if isinstance(node, parser.Concat):
+        items = node.items
+        return parser.Concat(tuple(
+            _make_reluctant(item, index + 1 < len(items) and isinstance(items[index + 1], parser.End))
+            for index, item in enumerate(items)))
+
+    if isinstance(node, parser.Group):
+        return parser.Group(_make_reluctant(node.node))
+
+    if isinstance(node, parser.Star):
+        return parser.Star(_make_reluctant(node.node), node.reluctant)
+
+    if isinstance(node, parser.Alternation):
+        return parser.Alternation(tuple(_make_reluctant(branch) for branch in node.branches))
+
+    return node
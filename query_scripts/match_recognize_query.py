@@ -2,13 +2,28 @@
 import textwrap
 
 class MatchRecognizeQuery:
-    def __init__(self, pattern, definitions, query_num, table_name):
+    def __init__(self, pattern, definitions, query_num, table_name, candidate_conditions=None):
         self.select_clause = textwrap.dedent(f"""
             -- QUERY: {query_num}
             -- TYPE: MATCH_RECOGNIZE
             SELECT COUNT(case_id)""")
         self.from_clause = textwrap.dedent(f"""
             FROM {table_name}""")
+
+        if candidate_conditions:
+            # Cases without every required activity cannot match, so they never reach the pattern matcher
+            self.from_clause = textwrap.dedent(f"""
+                FROM (
+                    SELECT *
+                    FROM {table_name}
+                    WHERE case_id IN (
+                        SELECT case_id
+                        FROM {table_name}
+                        WHERE {' OR '.join(candidate_conditions)}
+                        GROUP BY case_id
+                        HAVING {' AND '.join(f'COUNT_IF({condition}) > 0' for condition in candidate_conditions)}
+                    )
+                ) AS candidates""")
         self.match_recognize_clause = textwrap.dedent(f"""
             MATCH_RECOGNIZE (
                 PARTITION BY case_id
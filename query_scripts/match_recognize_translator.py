@@ -1,128 +1,102 @@
-import logging
+import signal_query_parser as parser
 
 class MatchRecognizeTranslator:
-    def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
+    def __init__(self, query_ast, activity_codes=None):
+        self.query_ast = query_ast
         self.pattern_parts = []
         self.definitions = {}
         self.alias_counter = 0
+        self.activity_codes = activity_codes
+        self.visitors = {
+            parser.Literal: self._visit_literal,
+            parser.Not: self._visit_not,
+            parser.AnyActivity: lambda node: self.pattern_parts.append('ANY'),
+            parser.Follows: lambda node: self.pattern_parts.append('(ANY)*'),
+            parser.Start: lambda node: self.pattern_parts.append('^'),
+            parser.End: lambda node: self.pattern_parts.append('$'),
+            parser.Group: self._visit_group,
+            parser.Star: self._visit_star,
+            parser.Concat: self._visit_concat,
+            parser.Alternation: self._visit_alternation,
+        }
 
     def translate(self):
-        while self.pos < len(self.tokens):
-            self._parse_next()
+        self._visit(self.query_ast)
 
+        # Unanchored queries may match anywhere inside the case
+        offset = 1 if isinstance(self.query_ast, parser.Group) else 0
+        if not parser.is_anchored(self.query_ast, parser.Start):
+            self.pattern_parts.insert(offset, '^ANY*')
+        if not parser.is_anchored(self.query_ast, parser.End):
+            self.pattern_parts.insert(len(self.pattern_parts) - offset, 'ANY*$')
 
-    def _parse_next(self):
-        token = self.tokens[self.pos]
-        if (self.pos == 1 and token != '^'):
-            self.pattern_parts.append('^ANY*')
-            self.pos += 1
 
-        elif (self.pos == len(self.tokens) - 2 and token != '$'):
-            self.pattern_parts.append('ANY*$')
-            self.pos += 1
+    def _visit(self, node):
+        self.visitors[type(node)](node)
 
-        elif token == 'NOT':
-            self._parse_not()
-
-        elif token.startswith("'"):
-            self._parse_literal()
-
-        elif token == '~>':
-            # self._parse_follows()
-            self.pattern_parts.append('(ANY)*')
-            self.pos += 1
-
-        elif token == 'ANY':
-            # self._parse_any()
-            self.pattern_parts.append('ANY')
-            self.pos += 1
-
-        elif token in ['^', '$', '*', '(', ')', '|']:
-            self.pattern_parts.append(token)
-            self.pos += 1
-
-        else:
-            self.pos += 1
-            logging.basicConfig(level=logging.ERROR)
-            logging.error(f"Unknown token: {token}")
-
-
-    def _parse_any(self):
-        self.pos += 1
-        append_star = False
-        if self.tokens[self.pos] == '*':
-            append_star = True
-            self.pos += 1
 
+    def _visit_literal(self, node):
         alias = self._next_alias()
-        self.definitions[alias] = f'{alias} AS activity != {self.tokens[self.pos]}'
+        activity = f"'{node.activity}'"
+        self.definitions[alias] = f'{alias} AS {self._activity_condition("=", activity)}'
         self.pattern_parts.append(alias)
 
-        if append_star:
-            self.pattern_parts.append('*')
-
 
-    def _parse_follows(self):
-        self.pos += 1
-        
+    def _visit_not(self, node):
         alias = self._next_alias()
-        self.definitions[alias] = f'{alias} AS activity != {self.tokens[self.pos]}'
+        self.definitions[alias] = self._create_definition(alias, [f"'{activity}'" for activity in node.activities])
         self.pattern_parts.append(alias)
 
 
-    def _parse_not(self):
-        self.pos += 1 # Skip 'NOT'
-        activities = []
+    def _visit_group(self, node):
+        self.pattern_parts.append('(')
+        self._visit(node.node)
+        self.pattern_parts.append(')')
 
-        if self.tokens[self.pos] == '(':
-            self.pos += 1 # Skip '('
-        
-        while self.tokens[self.pos] != ')':
-            if self.tokens[self.pos].startswith("'"):
-                activities.append(self.tokens[self.pos])
-                self.pos += 1
 
-            elif self.tokens[self.pos] == '|':
-                self.pos += 1
-                continue
+    def _visit_star(self, node):
+        self._visit(node.node)
+        self.pattern_parts.append('*?' if node.reluctant else '*')
 
-            else:
-                self.pos += 1
 
-        self.pos += 1 # Skip ')'
+    def _visit_concat(self, node):
+        for item in node.items:
+            self._visit(item)
+
+
+    def _visit_alternation(self, node):
+        for index, branch in enumerate(node.branches):
+            if index > 0:
+                self.pattern_parts.append('|')
+            self._visit(branch)
 
-        alias = self._next_alias()
-        self.definitions[alias] = self._create_definition(alias, activities)
-        self.pattern_parts.append(alias)
-        
     
     def _create_definition(self, alias, activities):
         definition = f'{alias} AS '
 
         for index, activity in enumerate(activities):
-            definition += f'activity != {activity}'
+            definition += self._activity_condition('!=', activity)
             if index < len(activities) - 1:
                 definition += ' AND '
 
         return definition
 
 
+    def _activity_condition(self, operator, activity):
+        if self.activity_codes is None:
+            return f'activity {operator} {activity}'
+
+        # Activities missing from the dictionary get code 0, which no event carries
+        code = self.activity_codes.get(activity.strip("'"), 0)
+        return f'activity_id {operator} {code}'
+
+
     def _next_alias(self):
         alias = chr(ord('A') + self.alias_counter)
         self.alias_counter += 1
 
         return alias
     
-    def _parse_literal(self):
-        alias = self._next_alias()
-        self.definitions[alias] = f'{alias} AS activity = {self.tokens[self.pos]}'
-        self.pattern_parts.append(alias)
-
-        self.pos += 1
-
-
     def _format_pattern(self):
         pattern_string = ""
 
@@ -131,7 +105,7 @@ class MatchRecognizeTranslator:
                  pattern_string += ' '
                  pattern_string += '('
 
-            elif token in {'(', ')', '*', '^', '$'}:
+            elif token in {'(', ')', '*', '*?', '^', '$'}:
                 pattern_string += token
             
             else:
@@ -144,4 +118,14 @@ class MatchRecognizeTranslator:
 
 
     def _format_definitions(self):
-        return ', '.join(self.definitions.values())
\ No newline at end of file
+        # DEFINE needs at least one variable, e.g. for (^ANY*$) left after optimizing ( 'A'* )
+        if not self.definitions:
+            return 'ANY AS true'
+
+        return ', '.join(self.definitions.values())
+
+
+    def _format_candidate_conditions(self):
+        # One condition per activity every match contains, none for negation-only patterns
+        return [self._activity_condition('=', f"'{activity}'")
+                for activity in sorted(parser.required_activities(self.query_ast))]
\ No newline at end of file
@@ -0,0 +1,305 @@
+import logging
+import multiprocessing
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+import convert_signal_queries_to_sql as converter
+import signal_query_parser as parser
+
+MODELS_DIR = converter.MODELS_DIR
+PERCENT_RANGE = converter.PERCENT_RANGE
+RESULTS_DIR = Path(__file__).parent.parent / 'results-reference'
+BENCHMARK_RESULTS_DIR = Path(__file__).parent.parent / 'results'  # Case counts from Trino to cross-check against
+WORKERS = 4  # Processes evaluating queries of one event log, 1 evaluates in this process
+MAX_DFA_STATES = 10000  # Guard against patterns whose subset construction explodes
+CASE_COLUMN = 'case_id'
+ACTIVITY_COLUMN = 'activity'
+POSITION_COLUMN = 'position'
+
+# Every activity a query does not mention behaves the same, so they share symbol class 0
+OTHER_ACTIVITIES = 0
+
+_worker_log = None
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    dataFrame = pd.read_csv(converter.CSV_PATH)
+    unique_models = dataFrame['model_id'].unique()
+
+    for model_num, model_id in enumerate(unique_models):
+        df_subset = dataFrame[dataFrame['model_id'] == model_id]
+        queries = [(query_num, row['signal_query']) for query_num, (_, row) in enumerate(df_subset.iterrows())]
+
+        for percent in PERCENT_RANGE:
+            model_version = f"model{model_num}_{model_id}_{percent}"
+            csv_file = MODELS_DIR / f"model{model_num}" / f"{model_version}.csv"
+            if not csv_file.exists():
+                logging.warning(f"Skipping {model_version}, {csv_file} does not exist")
+                continue
+
+            results = evaluate_file(csv_file, queries)
+
+            output_dir = RESULTS_DIR / f"model{model_num}"
+            output_dir.mkdir(parents=True, exist_ok=True)
+            results.to_csv(output_dir / f"{model_version}_reference.csv", index=False)
+
+            cross_check(results, BENCHMARK_RESULTS_DIR / f"model{model_num}" / f"{model_version}_results.csv")
+
+
+def evaluate_file(csv_file: Path, queries: list) -> pd.DataFrame:
+    if WORKERS <= 1:
+        _load_worker_log(csv_file)
+        results = [evaluate_query(query) for query in queries]
+
+    else:
+        with multiprocessing.Pool(WORKERS, initializer=_load_worker_log, initargs=(csv_file,)) as pool:
+            results = pool.map(evaluate_query, queries)
+
+    results = pd.DataFrame(results).astype({'case_count': 'Int64', 'dfa_states': 'Int64'})
+    logging.info(f"Evaluated {results['skipped'].isna().sum()}/{len(results)} queries over {csv_file}")
+    return results
+
+
+def _load_worker_log(csv_file):
+    global _worker_log
+    _worker_log = EventLog.from_csv(csv_file)
+
+
+def evaluate_query(query) -> dict:
+    query_num, signal_query = query
+
+    start_time = time.perf_counter()
+    try:
+        automaton = compile_signal_query(signal_query)
+    except ValueError as e:
+        # One query over MAX_DFA_STATES should not cost the results of the others
+        logging.warning(f"Skipping query {query_num}: {e}")
+        return {
+            "query_tag": query_num,
+            "case_count": None,
+            "dfa_states": None,
+            "compile_millis": None,
+            "eval_millis": None,
+            "skipped": str(e),
+        }
+
+    compiled_time = time.perf_counter()
+    case_count = automaton.count_matching_cases(_worker_log)
+    end_time = time.perf_counter()
+
+    return {
+        "query_tag": query_num,
+        "case_count": case_count,
+        "dfa_states": len(automaton.accepting),
+        "compile_millis": (compiled_time - start_time) * 1000,
+        "eval_millis": (end_time - compiled_time) * 1000,
+        "skipped": None,
+    }
+
+
+def cross_check(results: pd.DataFrame, benchmark_file: Path) -> pd.DataFrame:
+    if not benchmark_file.exists():
+        return pd.DataFrame()
+
+    benchmark = pd.read_csv(benchmark_file)
+    benchmark = benchmark[benchmark['query_id'] != 'FAILED']
+    if 'status' in benchmark.columns:
+        benchmark = benchmark[benchmark['status'] == 'FINISHED']
+
+    results = results[results['skipped'].isna()]
+    merged = results.assign(query_tag=results['query_tag'].astype(str)).merge(
+        benchmark.assign(query_tag=benchmark['query_tag'].astype(str)), on='query_tag')
+    mismatches = merged[merged['case_count'] != merged['result_case_count']]
+
+    for _, row in mismatches.iterrows():
+        logging.warning(f"{benchmark_file.name} query {row['query_tag']} [{row['query_type']}]: "
+                        f"reference counts {row['case_count']} cases, Trino {row['result_case_count']}")
+
+    return mismatches
+
+
+def compile_signal_query(signal_query: str) -> 'Automaton':
+    match_query = converter.find_matches(signal_query)
+
+    if match_query == '':
+        # Plain activity queries count the cases containing that activity
+        match_query = f"({converter.find_activity_in_query(signal_query)})"
+
+    return Automaton.from_pattern(parser.parse(match_query))
+
+
+class Automaton:
+    """Deterministic automaton over symbol classes: 0 for unmentioned activities, i + 1 for activities[i]."""
+
+    def __init__(self, activities, transitions, accepting, start_state):
+        self.activities = activities
+        self.transitions = transitions
+        self.accepting = accepting
+        self.start_state = start_state
+
+    @classmethod
+    def from_pattern(cls, node):
+        # Anchors only matter at the pattern edges, elsewhere they match the empty string
+        if not parser.is_anchored(node, parser.Start):
+            node = parser.Concat((parser.Star(parser.AnyActivity()), node))
+        if not parser.is_anchored(node, parser.End):
+            node = parser.Concat((node, parser.Star(parser.AnyActivity())))
+
+        activities = sorted(set(parser.activities_in_order(node)))
+        builder = _NfaBuilder({name: index + 1 for index, name in enumerate(activities)})
+        start, end = builder.build(node)
+
+        return cls(activities, *_determinize(builder, start, end, len(activities) + 1))
+
+    def count_matching_cases(self, log: 'EventLog') -> int:
+        class_of_code = np.full(len(log.activity_names), OTHER_ACTIVITIES, dtype=np.int32)
+        for index, name in enumerate(self.activities):
+            code = log.activity_index.get(name)
+            if code is not None:
+                class_of_code[code] = index + 1
+
+        symbols = class_of_code[log.codes]
+        states = np.full(len(log.case_starts), self.start_state, dtype=np.int32)
+
+        # Cases are sorted longest first, so the ones still running at step t are a prefix
+        for step, active in enumerate(log.active_cases):
+            states[:active] = self.transitions[states[:active], symbols[log.case_starts[:active] + step]]
+
+        return int(self.accepting[states].sum())
+
+
+class _NfaBuilder:
+    def __init__(self, activity_classes):
+        self.activity_classes = activity_classes
+        self.all_classes = frozenset(range(len(activity_classes) + 1))
+        self.epsilon = []
+        self.edges = []
+
+    def new_state(self):
+        self.epsilon.append([])
+        self.edges.append([])
+        return len(self.epsilon) - 1
+
+    def build(self, node):
+        if isinstance(node, (parser.Literal, parser.AnyActivity, parser.Not)):
+            return self._symbol(self._symbol_classes(node))
+
+        if isinstance(node, parser.Follows):
+            return self.build(parser.Star(parser.AnyActivity()))
+
+        if isinstance(node, parser.Group):
+            return self.build(node.node)
+
+        start, end = self.new_state(), self.new_state()
+
+        if isinstance(node, parser.Concat):
+            current = start
+            for item in node.items:
+                item_start, item_end = self.build(item)
+                self.epsilon[current].append(item_start)
+                current = item_end
+            self.epsilon[current].append(end)
+
+        elif isinstance(node, parser.Alternation):
+            for branch in node.branches:
+                branch_start, branch_end = self.build(branch)
+                self.epsilon[start].append(branch_start)
+                self.epsilon[branch_end].append(end)
+
+        elif isinstance(node, parser.Star):
+            inner_start, inner_end = self.build(node.node)
+            self.epsilon[start] += [inner_start, end]
+            self.epsilon[inner_end] += [inner_start, end]
+
+        else:  # Start and End
+            self.epsilon[start].append(end)
+
+        return start, end
+
+    def _symbol(self, classes):
+        start, end = self.new_state(), self.new_state()
+        self.edges[start].append((classes, end))
+        return start, end
+
+    def _symbol_classes(self, node):
+        if isinstance(node, parser.Literal):
+            return frozenset([self.activity_classes[node.activity]])
+
+        if isinstance(node, parser.AnyActivity):
+            return self.all_classes
+
+        return self.all_classes - {self.activity_classes[activity] for activity in node.activities}
+
+
+class EventLog:
+    def __init__(self, codes, activity_names, case_starts, case_lengths):
+        self.codes = codes
+        self.activity_names = activity_names
+        self.activity_index = {name: code for code, name in enumerate(activity_names)}
+
+        order = np.argsort(-case_lengths, kind='stable')
+        self.case_starts = case_starts[order]
+        lengths = case_lengths[order]
+
+        # Number of cases with more than t events, for every step t
+        max_length = int(lengths[0]) if len(lengths) else 0
+        self.active_cases = np.searchsorted(-lengths, -np.arange(max_length), side='left')
+
+    @classmethod
+    def from_csv(cls, csv_file):
+        df = pd.read_csv(csv_file, usecols=[CASE_COLUMN, ACTIVITY_COLUMN, POSITION_COLUMN])
+        df = df.sort_values([CASE_COLUMN, POSITION_COLUMN], kind='stable')
+
+        codes, activity_names = pd.factorize(df[ACTIVITY_COLUMN].astype(str))
+        case_ids = df[CASE_COLUMN].to_numpy()
+        boundaries = np.flatnonzero(case_ids[1:] != case_ids[:-1]) + 1 if len(case_ids) else np.array([], dtype=int)
+        case_starts = np.concatenate([[0], boundaries]) if len(case_ids) else boundaries
+        case_lengths = np.diff(np.concatenate([case_starts, [len(case_ids)]]))
+
+        return cls(codes.astype(np.int32), list(activity_names), case_starts, case_lengths)
+
+
+def _determinize(builder, start, end, num_classes):
+    def closure(states):
+        stack, seen = list(states), set(states)
+        while stack:
+            for target in builder.epsilon[stack.pop()]:
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return frozenset(seen)
+
+    start_set = closure([start])
+    state_ids = {start_set: 0}
+    pending = [start_set]
+    rows = []
+
+    while pending:
+        current = pending.pop(0)
+        row = []
+
+        for symbol in range(num_classes):
+            targets = closure([target for state in current
+                               for classes, target in builder.edges[state] if symbol in classes])
+
+            if targets not in state_ids:
+                if len(state_ids) >= MAX_DFA_STATES:
+                    raise ValueError(f"Signal query needs more than {MAX_DFA_STATES} automaton states")
+                state_ids[targets] = len(state_ids)
+                pending.append(targets)
+
+            row.append(state_ids[targets])
+        rows.append(row)
+
+    accepting = np.zeros(len(state_ids), dtype=bool)
+    for states, state_id in state_ids.items():
+        accepting[state_id] = end in states
+
+    return np.array(rows, dtype=np.int32), accepting, 0
+
+
+if __name__ == "__main__":
+    main()
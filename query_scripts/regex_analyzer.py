@@ -0,0 +1,307 @@
+import logging
+import re
+from itertools import combinations
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Second argument of regexp_like / regexp_extract / regexp_extract_all / regexp_position
+REGEX_LITERAL = re.compile(r"regexp_\w+\(\s*[\w.]+\s*,\s*'((?:[^']|'')*)'")
+ALL_CHARACTERS = (True, frozenset())  # (negated, characters): everything except no characters
+SINGLE_CHARACTER_OPS = ('LITERAL', 'NOT_LITERAL', 'ANY', 'IN')
+
+
+def find_superlinear_patterns(sql):
+    """Returns (pattern, issues) for every regex literal in sql whose matching cost is super-linear."""
+    flagged = []
+    for match in REGEX_LITERAL.finditer(sql):
+        pattern = match.group(1).replace("''", "'")
+        try:
+            issues = analyze_pattern(pattern)
+        except re.error as e:
+            # Trino's regex dialect is not Python's, such a pattern is left unchecked
+            logging.warning(f"Regex {pattern!r} could not be analyzed: {e}")
+            continue
+
+        if issues:
+            flagged.append((pattern, issues))
+
+    return flagged
+
+
+def analyze_pattern(pattern):
+    parsed = sre_parse.parse(pattern)
+    issues = []
+
+    _check_nested_repeats(list(parsed), issues)
+
+    if not _starts_with_anchor(list(parsed)):
+        _check_rescans(list(parsed), _first_characters(list(parsed)), False, issues)
+
+    return list(dict.fromkeys(issues))
+
+
+def _check_nested_repeats(items, issues, enclosing_repeats=()):
+    # An unbounded repeat inside another one is ambiguous when it can also consume what
+    # starts the outer body, so a failing match tries every way of splitting the text
+    for op, value in items:
+        name = op.name
+
+        if name in ('MAX_REPEAT', 'MIN_REPEAT'):
+            low, high, body = value
+            body_repeats = enclosing_repeats
+            if high == sre_parse.MAXREPEAT:
+                _check_ambiguous_branches(list(body), _first_characters(list(body)), issues)
+
+                for outer_first in enclosing_repeats:
+                    if _overlaps(_consumed_characters(list(body)), outer_first):
+                        issues.append("nested unbounded quantifier can split the outer repetition "
+                                      "in many ways (exponential backtracking)")
+                        break
+
+                body_repeats = enclosing_repeats + (_first_characters(list(body)),)
+
+            _check_nested_repeats(list(body), issues, body_repeats)
+
+        else:
+            for sub_items in _sub_patterns(op, value):
+                _check_nested_repeats(sub_items, issues, enclosing_repeats)
+
+
+def _check_ambiguous_branches(items, follow, issues):
+    # Alternatives in a repeated body that can match the same text, like (a|aa)*, give every
+    # run of repetitions many parses, and a failing match tries each of them
+    for index, (op, value) in enumerate(items):
+        name = op.name
+        rest = items[index + 1:]
+        after = _union(_first_characters(rest), follow) if _nullable(rest) else _first_characters(rest)
+
+        if name == 'BRANCH':
+            branches = [_flatten(list(branch)) for branch in value[1]]
+            if any(_branches_overlap(first, second, after) for first, second in combinations(branches, 2)):
+                issues.append("alternatives under an unbounded quantifier can match the same text "
+                              "(exponential backtracking)")
+
+        elif name == 'SUBPATTERN':
+            _check_ambiguous_branches(list(value[-1]), after, issues)
+
+
+def _branches_overlap(first, second, after):
+    # Walks both branches character by character. When one ends first, the rest of the
+    # other is ambiguous if the text after the branch can also start that way.
+    for index in range(max(len(first), len(second))):
+        if index == len(first) or index == len(second):
+            longer = second if index == len(first) else first
+            return _overlaps(_first_characters(longer[index:]), after)
+
+        (first_op, first_value), (second_op, second_value) = first[index], second[index]
+        if first_op.name not in SINGLE_CHARACTER_OPS or second_op.name not in SINGLE_CHARACTER_OPS:
+            return _overlaps(_first_characters(first[index:]), _first_characters(second[index:]))
+
+        if not _overlaps(_item_characters(first_op, first_value), _item_characters(second_op, second_value)):
+            return False
+
+    return True  # Both branches can match the same string
+
+
+def _flatten(items):
+    flat = []
+    for op, value in items:
+        flat += _flatten(list(value[-1])) if op.name == 'SUBPATTERN' else [(op, value)]
+
+    return flat
+
+
+def _check_rescans(items, pattern_first, tail_required, issues):
+    # In an unanchored pattern every position is a candidate start. An unbounded repeat
+    # that can run over the next candidate start, and still has to be followed by more
+    # text, scans the rest of the input again for each failed start (quadratic).
+    for index, (op, value) in enumerate(items):
+        name = op.name
+        required_after = tail_required or not _nullable(items[index + 1:])
+
+        if name in ('MAX_REPEAT', 'MIN_REPEAT'):
+            low, high, body = value
+            if high == sre_parse.MAXREPEAT and required_after:
+                if _guarded(list(body)):
+                    continue  # The guard also bounds every scan inside the body
+
+                if _overlaps(_consumed_characters(list(body)), pattern_first):
+                    issues.append("unbounded quantifier in an unanchored pattern rescans the input "
+                                  "from every failed start position (quadratic)")
+                    continue
+
+            _check_rescans(list(body), pattern_first, required_after, issues)
+
+        elif name not in ('POSSESSIVE_REPEAT', 'ATOMIC_GROUP'):
+            for sub_items in _sub_patterns(op, value):
+                _check_rescans(sub_items, pattern_first, required_after, issues)
+
+
+def _sub_patterns(op, value):
+    name = op.name
+
+    if name == 'SUBPATTERN':
+        return [list(value[-1])]
+
+    if name == 'BRANCH':
+        return [list(branch) for branch in value[1]]
+
+    if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        return [list(value[2])]
+
+    if name == 'ATOMIC_GROUP':
+        return [list(value)]
+
+    return []
+
+
+def _starts_with_anchor(items):
+    for op, value in items:
+        name = op.name
+        if name == 'AT':
+            return value.name in ('AT_BEGINNING', 'AT_BEGINNING_STRING')
+
+        if name == 'SUBPATTERN':
+            return _starts_with_anchor(list(value[-1]))
+
+        if name == 'BRANCH':
+            return all(_starts_with_anchor(list(branch)) for branch in value[1])
+
+        return False
+
+    return False
+
+
+def _guarded(body):
+    # A body with a negative lookahead after its fixed prefix, like (?:,(?!A)[^,]+),
+    # stops at the next start instead of running over it
+    for op, value in body:
+        name = op.name
+        if name == 'ASSERT_NOT':
+            return True
+
+        if name == 'SUBPATTERN':
+            return _guarded(list(value[-1]))
+
+        if name != 'LITERAL':
+            return False
+
+    return False
+
+
+def _nullable(items):
+    for op, value in items:
+        name = op.name
+
+        if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+            if value[0] > 0 and not _nullable(list(value[2])):
+                return False
+
+        elif name == 'SUBPATTERN':
+            if not _nullable(list(value[-1])):
+                return False
+
+        elif name == 'BRANCH':
+            if not any(_nullable(list(branch)) for branch in value[1]):
+                return False
+
+        elif name not in ('AT', 'ASSERT', 'ASSERT_NOT'):
+            return False
+
+    return True
+
+
+def _first_characters(items):
+    characters = (False, frozenset())
+    for op, value in items:
+        characters = _union(characters, _item_first_characters(op, value))
+        if not _nullable([(op, value)]):
+            break
+
+    return characters
+
+
+def _item_first_characters(op, value):
+    name = op.name
+
+    if name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT'):
+        return _first_characters(list(value[2]))
+
+    if name == 'SUBPATTERN':
+        return _first_characters(list(value[-1]))
+
+    if name == 'BRANCH':
+        characters = (False, frozenset())
+        for branch in value[1]:
+            characters = _union(characters, _first_characters(list(branch)))
+        return characters
+
+    return _item_characters(op, value)
+
+
+def _consumed_characters(items):
+    characters = (False, frozenset())
+    for op, value in items:
+        for sub_items in _sub_patterns(op, value):
+            characters = _union(characters, _consumed_characters(sub_items))
+
+        if not _sub_patterns(op, value):
+            characters = _union(characters, _item_characters(op, value))
+
+    return characters
+
+
+def _item_characters(op, value):
+    name = op.name
+
+    if name == 'LITERAL':
+        return (False, frozenset([value]))
+
+    if name == 'NOT_LITERAL':
+        return (True, frozenset([value]))
+
+    if name == 'ANY':
+        return ALL_CHARACTERS
+
+    if name == 'IN':
+        negated = any(item_op.name == 'NEGATE' for item_op, _ in value)
+        literals = frozenset(item_value for item_op, item_value in value if item_op.name == 'LITERAL')
+        if any(item_op.name not in ('NEGATE', 'LITERAL') for item_op, _ in value):
+            return ALL_CHARACTERS  # Ranges and categories are treated as anything
+
+        return (negated, literals)
+
+    return (False, frozenset())  # Anchors and lookarounds consume nothing
+
+
+def _union(first, second):
+    first_negated, first_characters = first
+    second_negated, second_characters = second
+
+    if not first_negated and not second_negated:
+        return (False, first_characters | second_characters)
+
+    if first_negated and second_negated:
+        return (True, first_characters & second_characters)
+
+    excluded, included = (first_characters, second_characters) if first_negated else (second_characters, first_characters)
+    return (True, excluded - included)
+
+
+def _overlaps(first, second):
+    first_negated, first_characters = first
+    second_negated, second_characters = second
+
+    if first_negated and second_negated:
+        return True
+
+    if first_negated:
+        return bool(second_characters - first_characters)
+
+    if second_negated:
+        return bool(first_characters - second_characters)
+
+    return bool(first_characters & second_characters)
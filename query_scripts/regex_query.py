@@ -1,17 +1,47 @@
 import textwrap
+import regexp_translator as rt
+
+# What joins the activities of a trace, per trace alphabet
+TRACE_SEPARATORS = {'delimited': ',', 'characters': ''}
+
+
+def trace_activity_expression(activity_code_width=None, trace_alphabet='delimited'):
+    if trace_alphabet == 'characters':
+        return f"CHR(activity_id + {rt.ACTIVITY_CODEPOINT_BASE})"
+
+    if activity_code_width is None:
+        return "activity"
+
+    return f"LPAD(CAST(activity_id AS VARCHAR), {activity_code_width}, '0')"
+
 
 class RegexQuery:
-    def __init__(self, table_name, sequences, query_num):
-        self.raw_traces = textwrap.dedent(f"""
-            -- QUERY: {query_num}
-            -- TYPE: regex
-            WITH raw_traces AS (
-                SELECT
-                    case_id,
-                    ARRAY_JOIN(ARRAY_AGG(activity ORDER BY position), ',') AS full_trace
-                FROM {table_name}
-                GROUP BY case_id
-            ), """)
+    def __init__(self, table_name, sequences, query_num, activity_code_width=None, trace_table=None,
+                 trace_alphabet='delimited'):
+        if trace_table is None:
+            self.raw_traces = textwrap.dedent(f"""
+                -- QUERY: {query_num}
+                -- TYPE: regex
+                -- SOURCE: events
+                WITH raw_traces AS (
+                    SELECT
+                        case_id,
+                        ARRAY_JOIN(ARRAY_AGG({trace_activity_expression(activity_code_width, trace_alphabet)} ORDER BY position), '{TRACE_SEPARATORS[trace_alphabet]}') AS full_trace
+                    FROM {table_name}
+                    GROUP BY case_id
+                ), """)
+
+        else:
+            self.raw_traces = textwrap.dedent(f"""
+                -- QUERY: {query_num}
+                -- TYPE: regex
+                -- SOURCE: traces
+                WITH raw_traces AS (
+                    SELECT
+                        case_id,
+                        full_trace
+                    FROM {trace_table}
+                ), """)
             
         self.sequences = sequences
 
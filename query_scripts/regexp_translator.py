@@ -1,56 +1,182 @@
 import logging
-import re
 import textwrap
+import signal_query_parser as parser
+
+# First codepoint of the 'characters' trace alphabet, the Unicode private use area,
+# so no activity character is a regex metacharacter or the separator of another alphabet
+ACTIVITY_CODEPOINT_BASE = 0xE000
+
+
+def activity_code_width(activity_codes):
+    return len(str(max(activity_codes.values(), default=0)))
+
+
+def format_activity_code(activity, activity_codes):
+    # Fixed-width codes keep every digit run aligned with one trace element,
+    # so a code can never match inside a longer one. Unknown activities get
+    # code 0, which no event carries.
+    code = activity_codes.get(activity, 0)
+    return str(code).zfill(activity_code_width(activity_codes))
+
+
+def format_activity_character(activity, activity_codes):
+    # One codepoint per activity, so every character of a trace is one element.
+    # Unknown activities get code 0 like in format_activity_code.
+    return chr(ACTIVITY_CODEPOINT_BASE + activity_codes.get(activity, 0))
+
+
+def _unstar(node):
+    return node.node if isinstance(node, parser.Star) else node
+
+
+def _is_starred_group(node, body_type):
+    return (isinstance(node, parser.Star) and isinstance(node.node, parser.Group)
+            and isinstance(node.node.node, body_type))
+
+
+def _has_shape(node, shape):
+    # shape lists the node types of a concatenation, e.g. (Literal, Follows, Literal)
+    return (isinstance(node, parser.Concat) and len(node.items) == len(shape)
+            and all(isinstance(item, item_type) for item, item_type in zip(node.items, shape)))
+
+
+def _followed_by_end(items, index):
+    return index + 1 < len(items) and isinstance(items[index + 1], parser.End)
+
+
+def _match_opening_negation(items, index):
+    return (isinstance(items[index], parser.Start) and index + 1 < len(items)
+            and isinstance(_unstar(items[index + 1]), parser.Not))
+
+
+def _match_closing_negation(items, index):
+    return (isinstance(items[index], parser.Star) and isinstance(items[index].node, parser.Not)
+            and _followed_by_end(items, index))
+
+
+def _match_closing_negation_or(items, index):
+    return _is_starred_group(items[index], parser.Alternation) and _followed_by_end(items, index)
+
+
+def _match_closing_directly_follows_negation(items, index):
+    node = items[index]
+    return (isinstance(node, parser.Group) and _has_shape(node.node, (parser.Literal, parser.Star))
+            and _followed_by_end(items, index))
+
+
+def _match_follows(items, index):
+    node = items[index]
+    return (_is_starred_group(node, parser.Concat)
+            and _has_shape(node.node.node, (parser.Literal, parser.Follows, parser.Literal)))
+
+
+def _match_any_follows(items, index):
+    node = items[index]
+    return (_is_starred_group(node, parser.Concat)
+            and _has_shape(node.node.node, (parser.Literal, parser.Star, parser.Literal))
+            and node.node.node.items[1] == parser.Star(parser.AnyActivity()))
+
+
+def _match_follows_negation(items, index):
+    node = items[index]
+    return (_is_starred_group(node, parser.Concat)
+            and _has_shape(node.node.node, (parser.Literal, parser.Star))
+            and isinstance(node.node.node.items[1].node, parser.Not))
+
+
+def _match_no_consecutive(items, index):
+    node = items[index]
+    return (_is_starred_group(node, parser.Concat)
+            and _has_shape(node.node.node, (parser.Literal, parser.Star, parser.Literal, parser.Star)))
+
+
+def _match_follows_trailing(items, index):
+    node = items[index]
+    return (_is_starred_group(node, parser.Alternation)
+            and all(isinstance(branch, parser.Group)
+                    and _has_shape(branch.node, (parser.Literal, parser.Star, parser.Literal, parser.Star))
+                    for branch in node.node.node.branches))
+
+
+# Checked in order, the first shape that matches the items at the current position wins.
+# The last field is how many top-level items the segment spans.
+SEGMENT_SHAPES = [
+    ("opening_negation", _match_opening_negation, 2),
+    ("closing_negation", _match_closing_negation, 2),
+    ("closing_negation_OR", _match_closing_negation_or, 2),
+    ("closing_directly_follows_negation", _match_closing_directly_follows_negation, 2),
+    ("in-directly_follows", _match_follows, 1),
+    ("in-directly_any_follows", _match_any_follows, 1),
+    ("directly_follows_negation", _match_follows_negation, 1),
+    ("no_consecutive", _match_no_consecutive, 1),
+    ("In-directly_follows_with_trailing", _match_follows_trailing, 1),
+]
+
+
+def split_into_segments(query_ast):
+    items = parser.top_level_items(query_ast)
+    segments = []
+    index = 0
+
+    while index < len(items):
+        for name, matcher, width in SEGMENT_SHAPES:
+            if matcher(items, index):
+                segment_items = items[index:index + width]
+                segments.append((name, segment_items[0] if width == 1 else parser.Concat(tuple(segment_items))))
+                index += width
+                break
+
+        else:
+            if not isinstance(items[index], (parser.Start, parser.End)):
+                logging.basicConfig(level=logging.ERROR)
+                logging.error(f"Unknown segment: {items[index]}")
+            index += 1
+
+    return segments
+
 
 class RegexpTranslator:
-    def __init__(self, tokens, regexp_patterns):
-        self.tokens = tokens
+    def __init__(self, query_ast, activity_codes=None, regex_mode='classic', trace_alphabet='delimited'):
+        if trace_alphabet == 'characters' and activity_codes is None:
+            raise ValueError("The 'characters' trace alphabet needs activity codes")
+
+        self.segments = split_into_segments(query_ast)
         self.pos = 0
         self.pattern_parts = []
-        self.regexp_patterns = regexp_patterns
+        self.activity_codes = activity_codes
+        self.regex_mode = regex_mode
+        self.trace_alphabet = trace_alphabet
+        self.segment_parsers = {
+            "opening_negation": self._parse_opening_not,
+            "closing_negation": self._parse_closing_not,
+            "in-directly_follows": self._parse_follows,
+            "in-directly_any_follows": self._parse_follows,
+            "directly_follows_negation": self._parse_follows_negation,
+            "no_consecutive": self._parse_no_consecutive,
+            "In-directly_follows_with_trailing": self._parse_follows_trailing,
+        }
 
     def translate(self):
-        while self.pos < len(self.tokens):
+        while self.pos < len(self.segments):
             self._parse_next()
             
     def _parse_next(self):
-        token = self.tokens[self.pos]
-
-        for name, pattern in self.regexp_patterns.items():
-            if re.match(pattern, token):
-                if name == "opening_negation":
-                    self._parse_opening_not()
-                    
-                elif name == "closing_negation":
-                    self._parse_closing_not()
-                    
-                elif name == "in-directly_follows" or name == "in-directly_any_follows":
-                    self._parse_follows()
-                    
-                elif name == "directly_follows_negation":
-                    self._parse_follows_negation()
-                    
-                elif name == "no_consecutive":
-                    self._parse_no_consecutive()
-                    
-                elif name == "In-directly_follows_with_trailing":
-                    self._parse_follows_trailing()
-                    
-                elif name == "closing_negation_OR" or name == "closing_directly_follows_negation":
-                    self.pos += 1
-                    
-                else:
-                    self.pos += 1  # Default increment if no specific parsing
-                return  # Exit after a match is found and processed
-
-        # If no pattern matches the token
-        logging.basicConfig(level=logging.ERROR)
-        logging.error(f"Unknown token: {token}")
-        self.pos += 1
+        name, _ = self.segments[self.pos]
+        segment_parser = self.segment_parsers.get(name)
+
+        if segment_parser is None:
+            self.pos += 1  # Shapes without SQL of their own, such as closing_negation_OR
+            return
+
+        segment_parser()
 
     def _parse_follows_trailing(self):
-        follows_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        activities = self._extract_activities(follows_tokens)
+        activities = self._extract_activities(self._current_segment())
+
+        if self.regex_mode == 'linear':
+            self.pattern_parts.append(self._linear_follows_trailing_segment(activities))
+            self.pos += 1
+            return
         
         follow_segment = textwrap.dedent(f"""
             sequences_of_interest AS (
@@ -59,7 +185,7 @@ class RegexpTranslator:
                         case_id,
                         segment_after_first,
                         regexp_extract(
-                            segment_after_first, '(({activities[0]}(,[^,]+)*,{activities[1]}(,[^,]+)*)|({activities[2]}(,[^,]+)*,{activities[3]}(,[^,]+)*))'
+                            segment_after_first, '{self._follows_trailing_pattern(activities)}'
                         ) AS sequence
                     FROM initial_segment
                 ),
@@ -85,8 +211,7 @@ class RegexpTranslator:
         self.pos += 1
 
     def _parse_no_consecutive(self):
-        follows_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        activities = self._extract_activities(follows_tokens)
+        activities = self._extract_activities(self._current_segment())
         
         follow_segment = textwrap.dedent(f"""
             sequences_of_interest AS (
@@ -95,7 +220,7 @@ class RegexpTranslator:
                         case_id,
                         segment_after_first,
                         regexp_extract_all(
-                            segment_after_first, '{activities[0]}(,[^,]+)*?,{activities[2]}'
+                            segment_after_first, '{self._no_consecutive_pattern(activities)}'
                         ) AS sequences
                     FROM initial_segment
                 ),
@@ -105,7 +230,7 @@ class RegexpTranslator:
                         segment_after_first,
                         sequences,
                         regexp_position(
-                            segment_after_first, '{activities[0]}(,[^,]+)*?,{activities[2]}',1,
+                            segment_after_first, '{self._no_consecutive_pattern(activities)}',1,
                             CAST(cardinality(sequences) AS INTEGER)
                         ) AS last_occurrence_position
                     FROM all_target_sequences
@@ -134,8 +259,7 @@ class RegexpTranslator:
         self.pos += 1
 
     def _parse_follows_negation(self):
-        follows_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        activities = self._extract_activities(follows_tokens)
+        activities = self._extract_activities(self._current_segment())
         
         follow_segment = textwrap.dedent(f"""
             sequences_of_interest AS (
@@ -153,11 +277,11 @@ class RegexpTranslator:
         self.pos += 1
 
     def _parse_opening_not(self):
-        negation_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        negation_clause = self._create_activity_clause(negation_tokens)
+        negated_activities = self._extract_activities(self._current_segment())
 
-        next_activities = self._find_next_activities()
-        negation_clause += '|' + next_activities
+        leading_activities = self._find_next_activities()
+        negation_clause = self._alternatives(negated_activities + leading_activities)
+        next_activities = self._alternatives(leading_activities)
 
         initial_segment = textwrap.dedent(f"""
             initial_segment AS (
@@ -181,8 +305,7 @@ class RegexpTranslator:
 
 
     def _parse_closing_not(self):
-        negation_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        negation_clause = self._create_activity_clause(negation_tokens)
+        negation_clause = self._create_activity_clause(self._current_segment())
 
         closing_negation_segment = textwrap.dedent(f"""
             SELECT COUNT(ini.case_id)
@@ -200,8 +323,7 @@ class RegexpTranslator:
         self.pos += 1 # Skip ')'
 
     def _parse_follows(self):
-        follows_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        activities = self._extract_activities(follows_tokens)
+        activities = self._extract_activities(self._current_segment())
         
         follow_segment = textwrap.dedent(f"""
             sequences_of_interest AS (
@@ -210,7 +332,7 @@ class RegexpTranslator:
                         case_id,
                         segment_after_first,
                         regexp_extract(
-                            segment_after_first, '{activities[0]}(,[^,]+)*,{activities[1]}'
+                            segment_after_first, '{self._follows_pattern(activities)}'
                         ) AS sequence
                     FROM initial_segment
                 ),
@@ -236,55 +358,118 @@ class RegexpTranslator:
         self.pos += 1
         # print("Follow Segment: " + follow_segment)
 
-    def _tokenize_to_operators(self, pattern):
-        token_pattern = re.compile(r"""
-            (
-                \^|\$|\(|\)|\*|\||~>|ANY|NOT|'[^']*'
-            )""", re.VERBOSE)
-        
-        return token_pattern.findall(pattern)
+    # 'linear' mode emits patterns that never retry a match from positions a failed attempt
+    # already scanned. Trace elements are never empty, so ',(?:.*,)?' matches the same text
+    # as '(,[^,]+)*,' and '(?:,.*)?' the same as a trailing '(,[^,]+)*'. Like the classic
+    # patterns, they assume no activity name occurs inside another one.
+    #
+    # In the 'characters' alphabet every character is one element, so any run of elements
+    # is '.*' and a run without some activity is a negated character class.
+    def _follows_pattern(self, activities):
+        # The segment starts at the first activity, the only position the classic pattern can match from
+        anchor = '^' if self.regex_mode == 'linear' else ''
+        if self.trace_alphabet == 'characters':
+            return f"{anchor}{activities[0]}.*{activities[1]}"
+
+        if self.regex_mode == 'linear':
+            return f"^{activities[0]},(?:.*,)?{activities[1]}"
+
+        return f"{activities[0]}(,[^,]+)*,{activities[1]}"
+
+    def _follows_trailing_pattern(self, activities):
+        if self.trace_alphabet == 'characters':
+            return f"(({activities[0]}.*{activities[1]}.*)|({activities[2]}.*{activities[3]}.*))"
+
+        return (f"(({activities[0]}(,[^,]+)*,{activities[1]}(,[^,]+)*)"
+                f"|({activities[2]}(,[^,]+)*,{activities[3]}(,[^,]+)*))")
+
+    def _first_occurrence_pattern(self, start, end):
+        # Only the first occurrence of start can begin a match: when it has no end after
+        # it, no later one has either. The tempered prefix stops there without retrying.
+        if self.trace_alphabet == 'characters':
+            return f"^[^{start}]*({start}.*{end}.*)"
+
+        return f"^(?:(?!{start}).)*({start},(?:.*,)?{end}(?:,.*)?)"
+
+    def _linear_follows_trailing_segment(self, activities):
+        # Both alternatives run to the end of the segment, so the longer one starts first,
+        # which is the one the classic alternation finds
+        return textwrap.dedent(f"""
+            sequences_of_interest AS (
+                WITH all_target_sequences AS (
+                    SELECT
+                        case_id,
+                        segment_after_first,
+                        LENGTH(regexp_extract(
+                            segment_after_first, '{self._first_occurrence_pattern(activities[0], activities[1])}', 1
+                        )) AS first_length,
+                        LENGTH(regexp_extract(
+                            segment_after_first, '{self._first_occurrence_pattern(activities[2], activities[3])}', 1
+                        )) AS second_length
+                    FROM initial_segment
+                ),
+                last_occurrence AS (
+                    SELECT
+                        case_id,
+                        segment_after_first,
+                        GREATEST(COALESCE(first_length, 0), COALESCE(second_length, 0)) AS last_occurrence_position
+                    FROM all_target_sequences
+                    WHERE COALESCE(first_length, second_length) > 0
+                )
+                SELECT
+                    case_id,
+                    segment_after_first,
+                    last_occurrence_position,
+                    substring(
+                        segment_after_first FROM last_occurrence_position
+                    ) AS segment_after_last_occurrence
+                FROM last_occurrence
+            )""")
+
+    def _no_consecutive_pattern(self, activities):
+        if self.regex_mode == 'linear':
+            # Every occurrence is extracted, so anchoring is not possible. Instead the scan
+            # gives up at the next start activity, where the following attempt takes over
+            # and ends on the same closing activity.
+            if self.trace_alphabet == 'characters':
+                return f"{activities[0]}[^{activities[0]}]*?{activities[2]}"
 
-    def _extract_activities(self, tokens):
-        activities = []
-        for token in tokens:
-            if token.startswith("'"):
-                activities.append(token.strip("'"))
+            return f"{activities[0]}(?:,(?!{activities[0]}(?:,|$))[^,]+)*?,{activities[2]}"
 
-        return activities
+        if self.trace_alphabet == 'characters':
+            return f"{activities[0]}.*?{activities[2]}"
+
+        return f"{activities[0]}(,[^,]+)*?,{activities[2]}"
+
+    def _current_segment(self):
+        return self.segments[self.pos][1]
+
+    def _extract_activities(self, node):
+        return [self._encode_activity(activity) for activity in parser.activities_in_order(node)]
 
     def _find_next_activities(self):
         self.pos += 1 
-        activities = ''
-        start_activity = True
-        
-        next_tokens = self._tokenize_to_operators(self.tokens[self.pos])
-        for token in next_tokens:
-            if token.startswith("'") and start_activity:
-                activities += token.strip("'")
-                start_activity = False
-
-            if token == '|':
-                start_activity = True
-                activities += '|'
-                
-        return activities
-
-    def _create_activity_clause(self, tokens):
-        activities = []
-        activity_clause = ''
-
-        for token in tokens:
-            if token.startswith("'"): # Is a literal
-                activities.append(token)
-
-        for index, activity in enumerate(activities):
-            if activity.startswith("'"):
-                activity_clause += activity.strip("'")
-
-                if index !=  (len(activities) - 1):
-                    activity_clause += '|'
-
-        return activity_clause
+        _, next_segment = self.segments[self.pos]
+
+        return [self._encode_activity(activity) for activity in parser.leading_activities(next_segment)]
+
+    def _create_activity_clause(self, node):
+        return self._alternatives(self._extract_activities(node))
+
+    def _alternatives(self, activities):
+        if self.trace_alphabet == 'characters':
+            return f"[{''.join(activities)}]"
+
+        return '|'.join(activities)
+    
+    def _encode_activity(self, activity):
+        if self.activity_codes is None:
+            return activity
+
+        if self.trace_alphabet == 'characters':
+            return format_activity_character(activity, self.activity_codes)
+
+        return format_activity_code(activity, self.activity_codes)
     
     def _return_sequences(self):
         return self.pattern_parts
\ No newline at end of file
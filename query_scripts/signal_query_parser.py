@@ -0,0 +1,236 @@
+import re
+from dataclasses import dataclass
+from typing import Tuple
+
+TOKEN_PATTERN = re.compile(r"\^|\$|\(|\)|\*|\||~>|ANY|NOT|'[^']*'")
+
+
+@dataclass(frozen=True)
+class Literal:
+    activity: str
+
+
+@dataclass(frozen=True)
+class AnyActivity:
+    pass
+
+
+@dataclass(frozen=True)
+class Not:
+    activities: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Follows:
+    pass
+
+
+@dataclass(frozen=True)
+class Start:
+    pass
+
+
+@dataclass(frozen=True)
+class End:
+    pass
+
+
+@dataclass(frozen=True)
+class Group:
+    node: object
+
+
+@dataclass(frozen=True)
+class Star:
+    node: object
+    reluctant: bool = False
+
+
+@dataclass(frozen=True)
+class Concat:
+    items: Tuple[object, ...]
+
+
+@dataclass(frozen=True)
+class Alternation:
+    branches: Tuple[object, ...]
+
+
+def tokenize(match_query):
+    return TOKEN_PATTERN.findall(match_query)
+
+
+def parse(match_query):
+    return SignalQueryParser(tokenize(match_query)).parse()
+
+
+class SignalQueryParser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.atom_parsers = {
+            '(': self._parse_group,
+            'ANY': lambda: AnyActivity(),
+            '~>': lambda: Follows(),
+            'NOT': self._parse_not,
+            '^': lambda: Start(),
+            '$': lambda: End(),
+        }
+
+    def parse(self):
+        node = self._parse_alternation()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected token {self.tokens[self.pos]!r} at position {self.pos}")
+
+        return node
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _advance(self):
+        token = self._peek()
+        if token is None:
+            raise ValueError("Unexpected end of signal query")
+
+        self.pos += 1
+        return token
+
+    def _expect(self, expected):
+        token = self._advance()
+        if token != expected:
+            raise ValueError(f"Expected {expected!r} but found {token!r} at position {self.pos - 1}")
+
+    def _parse_alternation(self):
+        branches = [self._parse_concat()]
+        while self._peek() == '|':
+            self.pos += 1
+            branches.append(self._parse_concat())
+
+        return branches[0] if len(branches) == 1 else Alternation(tuple(branches))
+
+    def _parse_concat(self):
+        items = []
+        while self._peek() not in (None, '|', ')'):
+            items.append(self._parse_repeat())
+
+        return items[0] if len(items) == 1 else Concat(tuple(items))
+
+    def _parse_repeat(self):
+        node = self._parse_atom()
+        while self._peek() == '*':
+            self.pos += 1
+            node = Star(node)
+
+        return node
+
+    def _parse_atom(self):
+        token = self._advance()
+
+        if token.startswith("'"):
+            return Literal(token.strip("'"))
+
+        atom_parser = self.atom_parsers.get(token)
+        if atom_parser is None:
+            raise ValueError(f"Unexpected token {token!r} at position {self.pos - 1}")
+
+        return atom_parser()
+
+    def _parse_group(self):
+        node = self._parse_alternation()
+        self._expect(')')
+        return Group(node)
+
+    def _parse_not(self):
+        self._expect('(')
+        activities = []
+
+        while self._peek() != ')':
+            token = self._advance()
+            if token.startswith("'"):
+                activities.append(token.strip("'"))
+            elif token != '|':
+                raise ValueError(f"Unexpected token {token!r} inside NOT at position {self.pos - 1}")
+
+        self._expect(')')
+        return Not(tuple(activities))
+
+
+def children(node):
+    if isinstance(node, (Group, Star)):
+        return (node.node,)
+
+    if isinstance(node, Concat):
+        return node.items
+
+    if isinstance(node, Alternation):
+        return node.branches
+
+    return ()
+
+
+def activities_in_order(node):
+    # Literal and negated activities, left to right
+    if isinstance(node, Literal):
+        return [node.activity]
+
+    if isinstance(node, Not):
+        return list(node.activities)
+
+    return [activity for child in children(node) for activity in activities_in_order(child)]
+
+
+def leading_activities(node):
+    # The activities a match of node can start with, one per alternative
+    if isinstance(node, Literal):
+        return [node.activity]
+
+    if isinstance(node, Not):
+        return list(node.activities)
+
+    if isinstance(node, Alternation):
+        return [activity for branch in node.branches for activity in leading_activities(branch)]
+
+    for child in children(node):
+        activities = leading_activities(child)
+        if activities:
+            return activities
+
+    return []
+
+
+def required_activities(node):
+    # The activities every match of node contains, empty when it can match with negations and ANY alone
+    if isinstance(node, Literal):
+        return {node.activity}
+
+    if isinstance(node, (Group, Concat)):
+        return set().union(*(required_activities(child) for child in children(node)))
+
+    if isinstance(node, Alternation):
+        return set.intersection(*(required_activities(branch) for branch in node.branches))
+
+    return set()
+
+
+def is_anchored(node, anchor_type):
+    if isinstance(node, anchor_type):
+        return True
+
+    if isinstance(node, Group):
+        return is_anchored(node.node, anchor_type)
+
+    if isinstance(node, Concat):
+        items = node.items if anchor_type is Start else node.items[::-1]
+        return bool(items) and is_anchored(items[0], anchor_type)
+
+    if isinstance(node, Alternation):
+        return all(is_anchored(branch, anchor_type) for branch in node.branches)
+
+    return False
+
+
+def top_level_items(node):
+    while isinstance(node, Group):
+        node = node.node
+
+    return list(node.items) if isinstance(node, Concat) else [node]
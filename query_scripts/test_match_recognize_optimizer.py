@@ -0,0 +1,25 @@
+import match_recognize_optimizer as optimizer
+import match_recognize_translator as mrt
+import signal_query_parser as parser
+
+
+def translate(match_query):
+    translator = mrt.MatchRecognizeTranslator(optimizer.optimize(parser.parse(match_query)))
+    translator.translate()
+    return translator
+
+
+def test_collapses_any_runs_and_makes_them_reluctant():
+    translator = translate("(ANY* 'A' ANY* ANY* 'B' ANY*)")
+
+    assert translator._format_pattern() == "(^ANY*? A ANY*? B ANY*$)"
+    assert translator._format_candidate_conditions() == ["activity = 'A'", "activity = 'B'"]
+
+
+def test_nullable_query_keeps_a_definition():
+    for match_query in ["( ('A' ~> 'B')* )", "( 'A'* )"]:
+        translator = translate(match_query)
+
+        assert translator._format_pattern() == "(^ANY*$)"
+        assert translator._format_definitions() == "ANY AS true"
+        assert translator._format_candidate_conditions() == []
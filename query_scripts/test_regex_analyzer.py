@@ -0,0 +1,27 @@
+import regex_analyzer
+
+
+def test_overlapping_alternatives_under_a_star_are_exponential():
+    for pattern in ['(a|aa)*c', '(?:a|a)*c', '(?:,(?:x|x,x))*z']:
+        assert any('exponential' in issue for issue in regex_analyzer.analyze_pattern(pattern)), pattern
+
+
+def test_nested_unbounded_quantifiers_are_exponential():
+    assert any('exponential' in issue for issue in regex_analyzer.analyze_pattern('(a+)+b'))
+
+
+def test_distinct_alternatives_are_not_exponential():
+    for pattern in ['(ab|ac)*d', '(a|ab)*c', '(?:,(?:x|xy))*,z']:
+        assert not any('exponential' in issue for issue in regex_analyzer.analyze_pattern(pattern)), pattern
+
+
+def test_linear_patterns_are_not_flagged():
+    for pattern in ['^A(,[^,]+)*,B', 'A(?:,(?!A(?:,|$))[^,]+)*?,C', 'abc']:
+        assert regex_analyzer.analyze_pattern(pattern) == [], pattern
+
+
+def test_unparsable_patterns_are_skipped():
+    sql = "regexp_like(full_trace, '(a+)+b') AND regexp_like(full_trace, '(unclosed')"
+
+    assert regex_analyzer.find_superlinear_patterns(sql) == [
+        ('(a+)+b', regex_analyzer.analyze_pattern('(a+)+b'))]